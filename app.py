@@ -10,14 +10,21 @@ from bson import ObjectId
 import logging
 import logging.handlers
 from dotenv import load_dotenv
+from config import Config
 from database import db_manager
-from chat import process_message_with_llm
+from chat import llm_processor, process_message_with_llm, stream_message_with_llm
 from context_tracker import ContextTracker
 from auth import (
     load_user, generate_letter_avatar, logger,
     datetimeformat, timeformat, get_auth_context
 )
-from models import DiseaseParameterWorkflow, DISEASE_PARAMETERS, get_predictor, validate_all_parameters
+from models import (
+    DiseaseParameterWorkflow, DISEASE_PARAMETERS, DISEASE_PREDICTORS, DISEASE_SCHEMAS,
+    map_profile, validate_all_parameters
+)
+from inference import inference_executor, speculative_scorer
+from sensitivity import sensitivity_analyzer
+from percentiles import reference_percentiles
 
 IST = pytz.timezone('Asia/Kolkata')
 
@@ -47,7 +54,7 @@ login_manager.login_view = 'login'
 if not db_manager.initialize_db():
     raise Exception("Failed to initialize database")
 
-context_tracker = ContextTracker.initialize(db_manager)
+context_tracker = ContextTracker.initialize(db_manager, summarizer=llm_processor.summarize)
 
 class CustomJSONEncoder:
     def encode(self, obj):
@@ -484,7 +491,20 @@ def handle_message(data):
         # Get conversation context and process message with LLM once
         context = ContextTracker().get_or_create_context(user_id, conversation_id)
         logger.info(f"Context for conversation {conversation_id}: {context}")
-        llm_result = process_message_with_llm(content, user_id, conversation_id, context)
+        response_id = str(ObjectId())
+        if Config.LLM_STREAMING:
+            # Forward response text while it is generated; messages are saved once it is complete
+            emit('ai_response_started', {'response_id': response_id, 'conversation_id': conversation_id})
+            llm_result = stream_message_with_llm(
+                content, user_id, conversation_id, context,
+                on_text=lambda delta: emit('ai_response_delta', {
+                    'response_id': response_id,
+                    'conversation_id': conversation_id,
+                    'delta': delta
+                })
+            )
+        else:
+            llm_result = process_message_with_llm(content, user_id, conversation_id, context)
         if not llm_result:
             emit('error', {'message': 'Failed to process message with LLM'})
             return
@@ -534,7 +554,7 @@ def handle_message(data):
             return
 
         emit('ai_response', {
-            'response_id': str(ObjectId()),
+            'response_id': response_id,
             'content': ai_response,
             'type': 'ai',
             'timestamp': timestamp.isoformat(),
@@ -628,11 +648,15 @@ def handle_parameter_received(data):
             return
         disease_type = prediction.get('disease_type', '').lower()
         parameters = prediction.get('parameters', {})
-        # Validate parameter using centralized validation
+        if parameter_name not in DISEASE_PARAMETERS.get(disease_type, {}):
+            emit('error', {'message': f'Unknown parameter: {parameter_name}'})
+            return
+        # Validate parameter using centralized validation; parameters not
+        # collected yet only mean the workflow is incomplete
         parameters[parameter_name] = parameter_value
         is_valid, errors = validate_all_parameters(disease_type, parameters)
-        if not is_valid:
-            emit('error', {'message': errors.get(parameter_name) or next(iter(errors.values()))})
+        if parameter_name in errors:
+            emit('error', {'message': errors[parameter_name]})
             return
         # Update parameter in database
         db_manager.predictions.update_one(
@@ -642,6 +666,13 @@ def handle_parameter_received(data):
                 'updated_at': datetime.now(IST)
             }}
         )
+        # Once the workflow is complete, start scoring before the user asks;
+        # schedule keeps a result already computed from the same inputs
+        if speculative_scorer is not None:
+            if is_valid and disease_type in DISEASE_PREDICTORS:
+                speculative_scorer.schedule(prediction_id, disease_type, parameters)
+            else:
+                speculative_scorer.invalidate(prediction_id)
         emit('parameter_updated', {
             'prediction_id': prediction_id,
             'parameter_name': parameter_name,
@@ -666,8 +697,7 @@ def handle_predict(data):
             return
         disease_type = prediction.get('disease_type', '').lower()
         parameters = prediction.get('parameters', {})
-        predictor = get_predictor(disease_type)
-        if not predictor:
+        if disease_type not in DISEASE_PREDICTORS:
             emit('error', {'message': f'No predictor found for {disease_type}'})
             return
         # Validate all parameters before prediction
@@ -675,12 +705,20 @@ def handle_predict(data):
         if not is_valid:
             emit('error', {'message': next(iter(errors.values()))})
             return
-        # Run prediction
+        # Use the speculative result if one was computed from these exact
+        # parameters, otherwise run the prediction off the event loop
         try:
-            prediction_result, confidence = predictor.predict(parameters)
+            speculative = None
+            if speculative_scorer is not None:
+                speculative = speculative_scorer.take(prediction_id, disease_type, parameters)
+            prediction_result, confidence, model_version = (
+                speculative or inference_executor.predict(disease_type, parameters)
+            )
             result = {
                 'prediction': prediction_result,
-                'confidence': confidence
+                'confidence': confidence,
+                'model_version': model_version,
+                'percentiles': reference_percentiles.lookup(disease_type, parameters)
             }
         except Exception as e:
             emit('error', {'message': f'Error during prediction: {str(e)}'})
@@ -703,6 +741,243 @@ def handle_predict(data):
         logger.error(f"Error handling prediction result: {e}")
         emit('error', {'message': f'Error handling prediction result: {str(e)}'})
 
+@app.route('/api/inference/metrics')
+@login_required
+def get_inference_metrics():
+    """Queue wait versus compute time of the inference executor."""
+    metrics = inference_executor.metrics()
+    metrics['speculative'] = speculative_scorer.metrics() if speculative_scorer is not None else None
+    metrics['sensitivity_cache'] = sensitivity_analyzer.stats()
+    return jsonify({
+        'status': 'success',
+        'metrics': metrics
+    })
+
+@app.route('/api/chat/metrics')
+@login_required
+def get_chat_metrics():
+    """Latency and reply parsing of LLM calls, and conversation summary refreshes."""
+    metrics = llm_processor.metrics()
+    metrics['summaries'] = dict(context_tracker.summary_stats)
+    return jsonify({
+        'status': 'success',
+        'metrics': metrics
+    })
+
+@app.route('/api/health/ready')
+def readiness():
+    """Readiness probe: 503 until the MODEL_WARMUP models have been loaded and warmed up."""
+    if not inference_executor.ready.is_set():
+        return jsonify({'status': 'warming_up'}), 503
+    return jsonify({'status': 'ready'})
+
+@app.route('/api/health/details')
+@login_required
+def readiness_details():
+    """Warm-up report per model and the inference sidecar's status."""
+    return jsonify({
+        'status': 'ready' if inference_executor.ready.is_set() else 'warming_up',
+        'models': inference_executor.warm_up_report,
+        'sidecar': inference_executor.sidecar_status()
+    })
+
+def run_batch_prediction(user_id, data):
+    """
+    Score many parameter sets with one model call per disease.
+
+    Accepts either ``prediction_ids`` (stored predictions owned by the user,
+    whose records are updated) or ``disease_type`` with a list of
+    ``parameters`` dicts (scored without being stored).
+
+    Returns:
+        (results, errors) lists keyed by prediction_id or list index
+    """
+    prediction_ids = data.get('prediction_ids')
+    parameter_sets = data.get('parameters')
+    if prediction_ids:
+        if len(prediction_ids) > Config.PREDICTION_BATCH_LIMIT:
+            raise ValueError(f'Batch size exceeds limit of {Config.PREDICTION_BATCH_LIMIT}')
+        found = {str(p['_id']): p for p in db_manager.get_predictions_by_ids(prediction_ids, user_id)}
+        items = []
+        errors = []
+        for prediction_id in prediction_ids:
+            prediction = found.get(str(prediction_id))
+            if not prediction:
+                errors.append({'prediction_id': prediction_id, 'message': 'Prediction not found'})
+                continue
+            items.append(('prediction_id', str(prediction_id),
+                          prediction.get('disease_type', '').lower(), prediction.get('parameters', {})))
+    elif parameter_sets and data.get('disease_type'):
+        if len(parameter_sets) > Config.PREDICTION_BATCH_LIMIT:
+            raise ValueError(f'Batch size exceeds limit of {Config.PREDICTION_BATCH_LIMIT}')
+        disease_type = data['disease_type'].lower()
+        items = [('index', idx, disease_type, params) for idx, params in enumerate(parameter_sets)]
+        errors = []
+    else:
+        raise ValueError('Either prediction_ids or disease_type with parameters is required')
+
+    # Group rows per disease so each is validated in bulk and scored in one model call
+    groups = {}
+    for key, ident, disease_type, parameters in items:
+        groups.setdefault(disease_type, []).append((key, ident, parameters))
+
+    results = []
+    updates = []
+    completed_at = datetime.now(IST)
+    for disease_type, rows in groups.items():
+        if disease_type not in DISEASE_PREDICTORS:
+            errors.extend({key: ident, 'message': f'No predictor found for {disease_type}'}
+                          for key, ident, _ in rows)
+            continue
+        schema = DISEASE_SCHEMAS.get(disease_type)
+        if schema is not None:
+            validation = schema.validate_batch([params for _, _, params in rows])
+            for row, row_errors in validation.failed_rows().items():
+                key, ident, _ = rows[row]
+                errors.append({key: ident, 'message': next(iter(row_errors.values()))})
+            rows = [row for row, valid in zip(rows, validation.valid.tolist()) if valid]
+            batch = validation.values[validation.valid]
+            percentiles = reference_percentiles.lookup_matrix(disease_type, batch)
+        else:
+            batch = [params for _, _, params in rows]
+            percentiles = [reference_percentiles.lookup(disease_type, params) for _, _, params in rows]
+        if not rows:
+            continue
+        try:
+            labels, confidences, model_version = inference_executor.predict_batch(disease_type, batch)
+        except Exception as e:
+            errors.extend({key: ident, 'message': f'Error during prediction: {str(e)}'}
+                          for key, ident, _ in rows)
+            continue
+        for (key, ident, _), label, confidence, row_percentiles in zip(
+                rows, labels.tolist(), confidences.tolist(), percentiles):
+            result = {'prediction': label, 'confidence': confidence, 'model_version': model_version,
+                      'percentiles': row_percentiles}
+            results.append({key: ident, 'disease_type': disease_type, 'result': result, 'status': 'completed'})
+            if key == 'prediction_id':
+                updates.append((ident, {'result': result, 'status': 'completed', 'completed_at': completed_at}))
+
+    if updates:
+        db_manager.bulk_update_predictions(updates)
+    return results, errors
+
+@socketio.on('predict_batch')
+@login_required
+def handle_predict_batch(data):
+    """Handle batched predict action for many predictions in one reply"""
+    try:
+        results, errors = run_batch_prediction(str(current_user.id), data or {})
+        emit('batch_prediction_completed', {'results': results, 'errors': errors})
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+    except Exception as e:
+        logger.error(f"Error handling batch prediction: {e}")
+        emit('error', {'message': f'Error handling batch prediction: {str(e)}'})
+
+@app.route('/api/predictions/batch', methods=['POST'])
+@login_required
+def predict_batch():
+    """
+    Score many predictions in one request.
+
+    Returns:
+        JSON response with per-item results and errors
+    """
+    try:
+        results, errors = run_batch_prediction(str(current_user.id), request.json or {})
+        return jsonify({
+            'status': 'success',
+            'results': results,
+            'errors': errors
+        })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error running batch prediction: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+def run_screening(profile):
+    """
+    Run every applicable disease model on one patient profile.
+
+    The profile is a flat dict of parameter names to values; each disease
+    takes the parameters it needs and the eligible ones are scored
+    concurrently.
+
+    Returns:
+        dict with per-disease results, prediction errors, missing and
+        invalid parameters, and diseases without a model
+    """
+    if not isinstance(profile, dict) or not profile:
+        raise ValueError('A patient profile is required')
+    mapped = map_profile(profile)
+    eligible = {disease: entry['parameters'] for disease, entry in mapped.items()
+                if not entry['missing'] and not entry['errors'] and disease in DISEASE_PREDICTORS}
+    outcomes = inference_executor.predict_many(eligible)
+
+    screening = {'results': {}, 'errors': {}, 'missing': {}, 'invalid': {}, 'unavailable': []}
+    for disease, entry in mapped.items():
+        if disease not in DISEASE_PREDICTORS:
+            screening['unavailable'].append(disease)
+        elif entry['errors']:
+            screening['invalid'][disease] = entry['errors']
+        elif entry['missing']:
+            screening['missing'][disease] = entry['missing']
+        elif isinstance(outcomes.get(disease), Exception):
+            screening['errors'][disease] = f'Error during prediction: {str(outcomes[disease])}'
+        else:
+            prediction_result, confidence, model_version = outcomes[disease]
+            screening['results'][disease] = {
+                'prediction': prediction_result,
+                'confidence': confidence,
+                'model_version': model_version,
+                'percentiles': reference_percentiles.lookup(disease, entry['parameters'])
+            }
+    return screening
+
+@socketio.on('screen')
+@login_required
+def handle_screen(data):
+    """Handle a multi-disease screening of one patient profile"""
+    try:
+        screening = run_screening((data or {}).get('profile'))
+        emit('screening_completed', screening)
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+    except Exception as e:
+        logger.error(f"Error handling screening: {e}")
+        emit('error', {'message': f'Error handling screening: {str(e)}'})
+
+@app.route('/api/screen', methods=['POST'])
+@login_required
+def screen_all_diseases():
+    """
+    Screen one patient profile against every disease model.
+
+    Returns:
+        JSON response with per-disease results and what is missing for the rest
+    """
+    try:
+        screening = run_screening((request.json or {}).get('profile'))
+        return jsonify({'status': 'success', **screening})
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error running screening: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
 
 
 @app.route('/api/predictions')
@@ -785,6 +1060,54 @@ def get_prediction(prediction_id):
             'message': str(e)
         }), 500
 
+@app.route('/api/prediction/<prediction_id>/sensitivity')
+@login_required
+def get_prediction_sensitivity(prediction_id):
+    """
+    What-if analysis of a completed prediction.
+
+    Query args:
+        parameters: one or two comma-separated parameter names to vary
+        steps: grid points per parameter (optional)
+
+    Returns:
+        JSON response with the grid axes and the risk at every grid point
+    """
+    try:
+        prediction = db_manager.get_prediction(prediction_id)
+        if not prediction or prediction['user_id'] != str(current_user.id):
+            return jsonify({
+                'status': 'error',
+                'message': 'Prediction not found'
+            }), 404
+        if prediction.get('status') != 'completed':
+            return jsonify({
+                'status': 'error',
+                'message': 'Prediction is not completed'
+            }), 400
+
+        names = [name.strip() for name in request.args.get('parameters', '').split(',') if name.strip()]
+        steps = request.args.get('steps', type=int)
+        analysis = sensitivity_analyzer.analyze(
+            str(prediction_id), prediction.get('disease_type', '').lower(),
+            prediction.get('parameters', {}), names, steps
+        )
+        return jsonify({
+            'status': 'success',
+            'sensitivity': analysis
+        })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error running sensitivity analysis: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @app.route('/api/prediction/<prediction_id>/delete', methods=['DELETE'])
 @login_required
 def delete_prediction(prediction_id):
@@ -1098,6 +1421,14 @@ def handle_disconnect():
     logger.info(f"Client disconnected: {request.sid}")
 
 
+# Warm up the MODEL_WARMUP models before the worker starts taking requests;
+# the rest load on first use
+inference_executor.warm_up()
+# Pick up retrained models without restarting (and dropping Socket.IO sessions)
+if Config.MODEL_HOT_RELOAD:
+    DISEASE_PREDICTORS.start_watcher()
+
+
 if __name__ == '__main__':
     try:
         # Start Flask application with SocketIO
@@ -0,0 +1,371 @@
+"""Offline benchmarks and parity checks for the disease prediction models.
+
+Usage:
+    python benchmark.py single-pass [--rows 200] [--repeat 200] [--seed 0]
+    python benchmark.py compiled [--rows 200] [--repeat 200] [--batch 1000]
+    python benchmark.py cold-start [--repeat 200]
+    python benchmark.py precision [--rows 5000] [--repeat 200] [--batch 1000]
+    python benchmark.py suite [--repeat 200] [--batch-sizes 1,10,100,1000] [--output results.json]
+                                [--baseline previous.json]
+
+Every command exits non-zero if a parity check fails.
+
+Inputs are DiseasePredictor.synthetic_inputs, the in-range rows warm-up and
+the accuracy guardrails use, so no database or network access is needed.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from compiled_models import compare_models, compile_model
+from config import Config
+from models import DISEASE_PARAMETERS, DISEASE_PREDICTORS, DISEASE_SCHEMAS, DiseasePredictor, estimate_model_memory
+
+logger = logging.getLogger(__name__)
+
+
+def model_width(predictor: DiseasePredictor, disease: str) -> int:
+    """Number of input columns the underlying estimator expects"""
+    return int(getattr(predictor.model, 'n_features_in_', len(DISEASE_PARAMETERS.get(disease, {}))))
+
+
+def legacy_predict(model: Any, input_array: np.ndarray) -> Tuple[Any, float]:
+    """Reference two-pass inference: predict_proba followed by predict"""
+    if hasattr(model, 'predict_proba'):
+        probabilities = model.predict_proba(input_array)[0]
+        prediction = model.predict(input_array)[0]
+        return prediction, max(probabilities) * 100
+    return model.predict(input_array)[0], 100.0
+
+
+def check_single_pass(predictor: DiseasePredictor, inputs: np.ndarray) -> int:
+    """Count rows where single-pass output differs from the two-pass reference"""
+    mismatches = 0
+    for row in inputs:
+        expected = legacy_predict(predictor.model, row[None, :])
+        labels, confidences = predictor.predict_batch(row[None, :])
+        actual = labels[0], confidences[0]
+        if expected[0] != actual[0] or not np.isclose(expected[1], actual[1]):
+            mismatches += 1
+    return mismatches
+
+
+def time_per_call(fn, repeat: int) -> List[float]:
+    """Wall-clock seconds for each of ``repeat`` calls to ``fn``"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_single_pass(disease: str, predictor: DiseasePredictor, rows: int, repeat: int, seed: int) -> Dict[str, Any]:
+    """Parity and median latency of two-pass versus single-pass inference"""
+    inputs = predictor.synthetic_inputs(rows, seed)
+    row = inputs[:1]
+    legacy = time_per_call(lambda: legacy_predict(predictor.model, row), repeat)
+    single = time_per_call(lambda: predictor.predict_batch(row), repeat)
+    return {
+        'disease': disease,
+        'mismatches': check_single_pass(predictor, inputs),
+        'rows_checked': rows,
+        'two_pass_p50_ms': float(np.median(legacy) * 1000),
+        'single_pass_p50_ms': float(np.median(single) * 1000),
+    }
+
+
+def bench_compiled(disease: str, predictor: DiseasePredictor, rows: int, repeat: int,
+                   batch: int, seed: int) -> Dict[str, Any]:
+    """Parity and speed of the compiled kernel against the estimator"""
+    estimator = predictor.model
+    kernel = compile_model(estimator)
+    inputs = predictor.synthetic_inputs(max(rows, batch), seed)
+    checked = inputs[:rows]
+
+    if hasattr(estimator, 'predict_proba'):
+        max_error = float(np.abs(kernel.predict_proba(checked) - estimator.predict_proba(checked)).max())
+        method = 'predict_proba'
+    else:
+        max_error = 0.0
+        method = 'predict'
+    label_mismatches = int((kernel.predict(checked) != estimator.predict(checked)).sum())
+
+    row, many = inputs[:1], inputs[:batch]
+    estimator_fn, kernel_fn = getattr(estimator, method), getattr(kernel, method)
+    return {
+        'disease': disease,
+        'kernel': type(kernel).__name__,
+        'label_mismatches': label_mismatches,
+        'max_proba_error': max_error,
+        'estimator_row_p50_ms': float(np.median(time_per_call(lambda: estimator_fn(row), repeat)) * 1000),
+        'kernel_row_p50_ms': float(np.median(time_per_call(lambda: kernel_fn(row), repeat)) * 1000),
+        'estimator_batch_ms': float(np.median(time_per_call(lambda: estimator_fn(many), 5)) * 1000),
+        'kernel_batch_ms': float(np.median(time_per_call(lambda: kernel_fn(many), 5)) * 1000),
+    }
+
+
+def bench_precision(disease: str, predictor: DiseasePredictor, rows: int, repeat: int,
+                    batch: int, seed: int) -> Dict[str, Any]:
+    """Accuracy, memory and speed of the float32 predictor against the float64 one
+
+    Both are built as the registry would serve them, and memory covers
+    everything a predictor holds (kernel and any estimator it keeps).
+    """
+    model_path, schema = DISEASE_PREDICTORS.resolve_path(disease), DISEASE_SCHEMAS.get(disease)
+    double = DiseasePredictor(model_path, compiled=DISEASE_PREDICTORS.compiled, schema=schema)
+    single = DiseasePredictor(model_path, compiled=DISEASE_PREDICTORS.compiled, schema=schema, precision='float32')
+    inputs = predictor.synthetic_inputs(max(rows, batch), seed)
+    report = compare_models(double.estimator, single.model, inputs[:rows])
+    row, many = inputs[:1], inputs[:batch]
+    return {
+        'disease': disease,
+        'kernel': type(single.model).__name__,
+        'precision': single.precision,
+        'label_mismatches': report['label_mismatches'],
+        'max_confidence_drift': report['max_confidence_drift'],
+        'float64_kib': estimate_model_memory((double.model, double.estimator)) / 1024,
+        'float32_kib': estimate_model_memory((single.model, single.estimator)) / 1024,
+        'float64_row_p50_ms': float(np.median(time_per_call(lambda: double.predict_batch(row), repeat)) * 1000),
+        'float32_row_p50_ms': float(np.median(time_per_call(lambda: single.predict_batch(row), repeat)) * 1000),
+        'float64_batch_ms': float(np.median(time_per_call(lambda: double.predict_batch(many), 5)) * 1000),
+        'float32_batch_ms': float(np.median(time_per_call(lambda: single.predict_batch(many), 5)) * 1000),
+    }
+
+
+def measure_cold_start(disease: str, warm: bool, repeat: int, seed: int) -> Dict[str, Any]:
+    """Load a model in a fresh process and time its first and later predictions
+
+    Meant to run in a new interpreter (see run_cold_start), so the load
+    includes sklearn's lazy imports and the first call pays every one-off
+    cost unless ``warm`` runs DiseasePredictor.warm_up first.
+    """
+    started = time.perf_counter()
+    predictor = DiseasePredictor(DISEASE_PREDICTORS.resolve_path(disease), compiled=DISEASE_PREDICTORS.compiled,
+                                 schema=DISEASE_SCHEMAS.get(disease))
+    load_ms = (time.perf_counter() - started) * 1000
+    warm_up_ms = predictor.warm_up() * 1000 if warm else 0.0
+
+    inputs = iter(predictor.synthetic_inputs(repeat + 1, seed))
+    predict_next = lambda: predictor.predict_batch(next(inputs)[None, :])
+    first = time_per_call(predict_next, 1)[0]
+    steady = time_per_call(predict_next, repeat)
+    return {
+        'disease': disease,
+        'warm_up': warm,
+        'load_ms': load_ms,
+        'warm_up_ms': warm_up_ms,
+        'first_predict_ms': first * 1000,
+        'steady_p50_ms': float(np.median(steady) * 1000),
+        'steady_p99_ms': float(np.percentile(steady, 99) * 1000),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB (ru_maxrss is KiB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_model(disease: str, repeat: int, batch_sizes: List[int], seed: int) -> Dict[str, Any]:
+    """Load, latency, throughput and memory figures for one model
+
+    Meant to run in a fresh interpreter (see run_suite). The first load
+    pays for the imports the pickle needs; loading again measures the
+    unpickle alone, and the difference is reported as import time.
+    """
+    model_path = DISEASE_PREDICTORS.resolve_path(disease)
+    schema = DISEASE_SCHEMAS.get(disease)
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    DiseasePredictor(model_path, compiled=DISEASE_PREDICTORS.compiled, schema=schema)
+    first_load = time.perf_counter() - started
+    started = time.perf_counter()
+    predictor = DiseasePredictor(model_path, compiled=DISEASE_PREDICTORS.compiled, schema=schema)
+    unpickle = time.perf_counter() - started
+    predictor.warm_up()
+
+    width = model_width(predictor, disease)
+    inputs = predictor.synthetic_inputs(max(repeat, max(batch_sizes)), seed)
+    rows = iter(inputs[:repeat])
+    latency = np.array(time_per_call(lambda: predictor.predict_batch(next(rows)[None, :]), repeat)) * 1000
+    p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+
+    throughput = {}
+    for size in batch_sizes:
+        batch = inputs[:size]
+        seconds = float(np.median(time_per_call(lambda: predictor.predict_batch(batch), 5)))
+        throughput[str(size)] = size / seconds
+
+    return {
+        'model': type(predictor.model).__name__,
+        'path': model_path,
+        'n_features': width,
+        'import_ms': max(first_load - unpickle, 0.0) * 1000,
+        'unpickle_ms': unpickle * 1000,
+        'latency_ms': {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'mean': float(latency.mean())},
+        'throughput_rows_per_s': throughput,
+        'baseline_rss_mb': rss_before,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_metadata(args) -> Dict[str, Any]:
+    """Environment details stored with suite results so runs can be compared"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        import sklearn
+        sklearn_version = sklearn.__version__
+    except ImportError:
+        sklearn_version = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sklearn': sklearn_version,
+        'machine': platform.machine(),
+        'backend': 'compiled' if DISEASE_PREDICTORS.compiled else 'sklearn',
+        'repeat': args.repeat,
+        'seed': args.seed,
+    }
+
+
+def compare_results(results: Dict[str, Any], baseline_path: str):
+    """Print p50 latency and largest-batch throughput relative to an earlier run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline['metadata'].get('commit')}):")
+    for disease, r in results['models'].items():
+        before = baseline['models'].get(disease)
+        if before is None:
+            continue
+        p50_ratio = r['latency_ms']['p50'] / before['latency_ms']['p50']
+        shared = [size for size in r['throughput_rows_per_s'] if size in before['throughput_rows_per_s']]
+        line = f"{disease:<15}p50 {p50_ratio:>6.2f}x"
+        if shared:
+            size = max(shared, key=int)
+            ratio = r['throughput_rows_per_s'][size] / before['throughput_rows_per_s'][size]
+            line += f"   rows/s @{size} {ratio:>6.2f}x"
+        print(line)
+
+
+def run_suite(args) -> bool:
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    results = {'metadata': run_metadata(args), 'models': {}}
+    print(f"{'disease':<15}{'import ms':>10}{'unpickle':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'rows/s @' + str(batch_sizes[-1]):>16}{'peak MiB':>10}")
+    # A fresh interpreter per model keeps import time and peak RSS attributable
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for disease in DISEASE_PREDICTORS:
+            r = pool.apply(measure_model, (disease, args.repeat, batch_sizes, args.seed))
+            results['models'][disease] = r
+            latency = r['latency_ms']
+            print(f"{disease:<15}{r['import_ms']:>10.1f}{r['unpickle_ms']:>10.1f}{latency['p50']:>9.3f}"
+                  f"{latency['p95']:>9.3f}{latency['p99']:>9.3f}"
+                  f"{r['throughput_rows_per_s'][str(batch_sizes[-1])]:>16.0f}{r['peak_rss_mb']:>10.1f}")
+    if args.baseline:
+        compare_results(results, args.baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return True
+
+
+def run_single_pass(args) -> bool:
+    print(f"{'disease':<15}{'mismatch':>10}{'2-pass ms':>12}{'1-pass ms':>12}{'speedup':>9}")
+    ok = True
+    for disease, predictor in DISEASE_PREDICTORS.items():
+        result = bench_single_pass(disease, predictor, args.rows, args.repeat, args.seed)
+        ok = ok and result['mismatches'] == 0
+        speedup = result['two_pass_p50_ms'] / result['single_pass_p50_ms']
+        print(f"{disease:<15}{result['mismatches']:>10}{result['two_pass_p50_ms']:>12.3f}"
+              f"{result['single_pass_p50_ms']:>12.3f}{speedup:>8.2f}x")
+    return ok
+
+
+def run_compiled(args) -> bool:
+    print(f"{'disease':<15}{'kernel':<24}{'mismatch':>9}{'max err':>10}"
+          f"{'row ms':>16}{'row x':>7}{f'batch[{args.batch}] ms':>22}{'batch x':>8}")
+    ok = True
+    for disease, predictor in DISEASE_PREDICTORS.items():
+        r = bench_compiled(disease, predictor, args.rows, args.repeat, args.batch, args.seed)
+        ok = ok and r['label_mismatches'] == 0 and r['max_proba_error'] < 1e-9
+        print(f"{disease:<15}{r['kernel']:<24}{r['label_mismatches']:>9}{r['max_proba_error']:>10.1e}"
+              f"{r['estimator_row_p50_ms']:>8.3f}/{r['kernel_row_p50_ms']:<7.3f}"
+              f"{r['estimator_row_p50_ms'] / r['kernel_row_p50_ms']:>6.1f}x"
+              f"{r['estimator_batch_ms']:>12.2f}/{r['kernel_batch_ms']:<9.2f}"
+              f"{r['estimator_batch_ms'] / r['kernel_batch_ms']:>7.1f}x")
+    return ok
+
+
+def run_precision(args) -> bool:
+    print(f"{'disease':<15}{'served':<9}{'mismatch':>9}{'drift pts':>11}{'KiB 64/32':>18}"
+          f"{'row ms 64/32':>18}{f'batch[{args.batch}] ms 64/32':>26}")
+    ok = True
+    for disease, predictor in DISEASE_PREDICTORS.items():
+        r = bench_precision(disease, predictor, args.rows, args.repeat, args.batch, args.seed)
+        ok = ok and r['label_mismatches'] == 0 and r['max_confidence_drift'] <= Config.PRECISION_TOLERANCE
+        print(f"{disease:<15}{r['precision']:<9}{r['label_mismatches']:>9}{r['max_confidence_drift']:>11.1e}"
+              f"{r['float64_kib']:>10.0f}/{r['float32_kib']:<7.0f}"
+              f"{r['float64_row_p50_ms']:>10.3f}/{r['float32_row_p50_ms']:<7.3f}"
+              f"{r['float64_batch_ms']:>16.2f}/{r['float32_batch_ms']:<9.2f}")
+    return ok
+
+
+def run_cold_start(args) -> bool:
+    print(f"{'disease':<15}{'warm-up':<9}{'load ms':>10}{'warm ms':>10}{'first ms':>10}"
+          f"{'p50 ms':>10}{'p99 ms':>10}{'first/p50':>11}")
+    # One spawned interpreter per measurement so nothing is imported or cached yet
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for disease in DISEASE_PREDICTORS:
+            for warm in (False, True):
+                r = pool.apply(measure_cold_start, (disease, warm, args.repeat, args.seed))
+                print(f"{disease:<15}{'yes' if warm else 'no':<9}{r['load_ms']:>10.1f}{r['warm_up_ms']:>10.1f}"
+                      f"{r['first_predict_ms']:>10.3f}{r['steady_p50_ms']:>10.3f}{r['steady_p99_ms']:>10.3f}"
+                      f"{r['first_predict_ms'] / r['steady_p50_ms']:>10.1f}x")
+    return True
+
+
+COMMANDS = {
+    'single-pass': run_single_pass,
+    'compiled': run_compiled,
+    'cold-start': run_cold_start,
+    'suite': run_suite,
+    'precision': run_precision,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('--rows', type=int, default=200, help='synthetic rows used for parity checks')
+    parser.add_argument('--repeat', type=int, default=200, help='timed calls per measurement')
+    parser.add_argument('--batch', type=int, default=1000, help='rows per batch measurement')
+    parser.add_argument('--batch-sizes', default='1,10,100,1000', help='comma-separated batch sizes for throughput')
+    parser.add_argument('--output', help='write suite results to this JSON file')
+    parser.add_argument('--baseline', help='earlier suite JSON to compare against')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    raise SystemExit(0 if COMMANDS[args.command](args) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""In-process LRU+TTL caches with an optional shared Redis backend."""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Least-recently-used cache whose entries also expire after ``ttl`` seconds"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared cache of JSON values in Redis, so workers and hosts reuse results"""
+
+    def __init__(self, client: Any, prefix: str, ttl: float):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = int(ttl)
+
+    def get(self, key: str) -> Any:
+        try:
+            raw = self.client.get(self.prefix + key)
+            return json.loads(raw) if raw is not None else None
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+
+    def set(self, key: str, value: Any):
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+
+def shared_backend(url: str, prefix: str, ttl: float) -> Optional[RedisBackend]:
+    """Redis backend for ``url``, or None when unset or redis is not installed"""
+    if not url:
+        return None
+    try:
+        import redis
+    except ImportError:
+        logger.warning("CACHE_REDIS_URL is set but the redis package is not installed")
+        return None
+    return RedisBackend(redis.Redis.from_url(url), prefix, ttl)
+
+
+def to_python(value: Any) -> Any:
+    """Convert NumPy scalars to plain Python values (JSON and BSON friendly)"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class PredictionCache:
+    """Prediction results keyed by disease, feature vector and model version
+
+    A retrained model gets a new version, so its results never mix with
+    cached results of the previous one.
+    """
+
+    def __init__(self, local: TTLCache, shared: Optional[RedisBackend] = None):
+        self.local = local
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls) -> Optional['PredictionCache']:
+        if Config.PREDICTION_CACHE_SIZE <= 0:
+            return None
+        ttl = Config.PREDICTION_CACHE_TTL
+        return cls(
+            TTLCache(Config.PREDICTION_CACHE_SIZE, ttl),
+            shared_backend(Config.CACHE_REDIS_URL, 'medipredict:prediction:v2:', ttl),
+        )
+
+    @staticmethod
+    def key(disease: str, features: Any, version: str) -> str:
+        vector = np.ascontiguousarray(features, dtype=np.float64)
+        digest = hashlib.sha1(vector.tobytes()).hexdigest()
+        return f"{disease}:{version}:{digest}"
+
+    def get(self, key: str) -> Optional[tuple]:
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                value = tuple(value)
+                self.local.set(key, value)
+                self.shared_hits += 1
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: tuple):
+        value = tuple(to_python(v) for v in value)
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, list(value))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.local),
+        }
@@ -1,17 +1,133 @@
+import hashlib
+import json
 import logging
 import os
-import json
+import re
+import time
+import unicodedata
 import groq
 from dotenv import load_dotenv
+from cache import TTLCache, shared_backend
 from config import Config
-from system_prompts import SYSTEM_PROMPTS
+from metrics import RollingStats
+from llm_json import ParseStats, ReplyParseError, StructuredReplyParser
+from system_prompts import (
+    FULL_PROMPT_TOKENS, PROMPT_SECTIONS, SUMMARY_PROMPT, assemble_prompt, detect_intents, normalize_intent
+)
+from token_counter import messages_tokens
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+def normalize_message(message):
+    """Case, spacing and punctuation-insensitive form of a message, for cache keys"""
+    text = unicodedata.normalize('NFKC', message or '').casefold()
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+
+
+class ResponseCache:
+    """LLM replies keyed by normalized message, conversation context and prompt version
+
+    Entries are shared across users and conversations, so the key covers
+    everything the model is sent besides the system prompt: the summary
+    and every earlier message. Only requests with no summary and at most
+    ``context_messages`` earlier messages use the cache, so a reply that
+    drew on one patient's history is never served to another. Requests
+    whose detected or previous intent is in ``skip_intents`` bypass the
+    cache too, and replies are only stored when they parsed cleanly and
+    their own intent is not skipped.
+    """
+
+    def __init__(self, local, shared=None, context_messages=2, skip_intents=()):
+        self.local = local
+        self.shared = shared
+        self.context_messages = context_messages
+        self.skip_intents = set(skip_intents)
+        self.hits = 0
+        self.exact_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stored = 0
+
+    @classmethod
+    def from_config(cls):
+        if Config.LLM_CACHE_SIZE <= 0:
+            return None
+        ttl = Config.LLM_CACHE_TTL
+        return cls(
+            TTLCache(Config.LLM_CACHE_SIZE, ttl),
+            shared_backend(Config.CACHE_REDIS_URL, 'medipredict:llm:v1:', ttl),
+            context_messages=Config.LLM_CACHE_CONTEXT_MESSAGES,
+            skip_intents=[intent.strip() for intent in Config.LLM_CACHE_SKIP_INTENTS.split(',') if intent.strip()],
+        )
+
+    def key(self, model, message, conversation_messages, prompt_version, summary=None):
+        payload = json.dumps([
+            model,
+            prompt_version,
+            normalize_message(message),
+            [[msg.get('type'), normalize_message(msg.get('content'))] for msg in conversation_messages],
+            normalize_message(summary),
+        ])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def skips(self, intents, conversation_messages=(), summary=None):
+        """Whether a request must not use the cache, by its intents and context"""
+        if summary or len(conversation_messages) > self.context_messages or self.skip_intents & set(intents):
+            self.skipped += 1
+            return True
+        return False
+
+    def get(self, key, message):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+                self.shared_hits += 1
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if value.get('message') == message:
+            self.exact_hits += 1
+        return value['reply']
+
+    def set(self, key, message, result):
+        if result.get('outcome') != 'clean' or normalize_intent(result.get('intent')) in self.skip_intents:
+            return
+        value = {
+            'message': message,
+            'reply': {field: result.get(field) for field in ('intent', 'entities', 'confidence', 'response')},
+        }
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+        self.stored += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'exact_hits': self.exact_hits,
+            'normalized_hits': self.hits - self.exact_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'skipped': self.skipped,
+            'stored': self.stored,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.local),
+        }
+
+
 class LLMProcessor:
+    model = 'llama3-70b-8192'
+    temperature = 0.5
+    max_tokens = 512
+
     def __init__(self):
         try:
             api_key = Config.GROQ_API_KEY
@@ -19,80 +135,261 @@ class LLMProcessor:
                 logger.error('GROQ_API_KEY not found in environment variables.')
                 self.client = None
             else:
-                self.client = groq.Client(api_key=api_key,proxies=None)
+                self.client = groq.Client(api_key=api_key, base_url=Config.GROQ_BASE_URL or None)
         except Exception as e:
             logger.error(f'Error initializing Groq client: {e}')
             self.client = None
+        # Time until the user sees the first words (for blocking calls, the whole call)
+        self.first_text = {'streaming': RollingStats(), 'blocking': RollingStats()}
+        self.total = {'streaming': RollingStats(), 'blocking': RollingStats()}
+        self.first_token = RollingStats()
+        self.cache = ResponseCache.from_config()
+        self.parse_stats = ParseStats()
+        self.prompt_tokens = {'system': RollingStats(), 'estimated': RollingStats(), 'reported': RollingStats()}
+        self.errors = 0
+
+    def _build_messages(self, input_data):
+        """Chat messages for a request and the system prompt they start with"""
+        user_message = input_data.get("message", "")
+        conversation_messages = input_data.get("messages", [])
+
+        # Only the prompt sections for what the user is doing now or was doing last turn
+        if Config.LLM_SCOPED_PROMPT:
+            intents = self._request_intents(input_data)
+        else:
+            intents = {section_intent for section in PROMPT_SECTIONS for section_intent in section.intents or ()}
+        prompt = assemble_prompt(intents)
+
+        # Start with the system prompt
+        messages = [{"role": "system", "content": prompt.text}]
+
+        # Older turns that no longer fit the context window
+        if input_data.get("summary"):
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{input_data['summary']}"})
+
+        # Add previous messages (context)
+        for msg in conversation_messages:
+            # Ensure each message has the required role property
+            role = 'user' if msg.get('type') == 'user' else 'assistant'
+            messages.append({
+                'role': role,
+                'content': msg.get('content', '')
+            })
+
+        # Add current user message
+        messages.append({"role": "user", "content": user_message})
+        return messages, prompt
+
+    @staticmethod
+    def _request_intents(input_data):
+        """Intents detected in the message plus the one stored for the previous user message"""
+        intents = detect_intents(input_data.get("message", ""))
+        previous = next((msg['metadata']['intent'] for msg in reversed(input_data.get("messages", []))
+                         if msg.get('type') == 'user' and (msg.get('metadata') or {}).get('intent')), None)
+        if previous:
+            intents.add(normalize_intent(previous))
+        return intents
+
+    def _cached_reply(self, input_data, prompt):
+        """Cached reply and the key to store a fresh one under; no key when the request skips the cache"""
+        conversation_messages, summary = input_data.get("messages", []), input_data.get("summary")
+        if self.cache is None or self.cache.skips(self._request_intents(input_data), conversation_messages, summary):
+            return None, None
+        key = self.cache.key(self.model, input_data.get("message", ""), conversation_messages, prompt.version, summary)
+        cached = self.cache.get(key, input_data.get("message", ""))
+        return (dict(cached, cached=True) if cached is not None else None), key
+
+    def _record_prompt(self, prompt, messages, usage=None):
+        """Track prompt size per request; ``usage`` is the API's own count when it sends one"""
+        estimated = messages_tokens(messages)
+        reported = usage.get('prompt_tokens') if isinstance(usage, dict) else getattr(usage, 'prompt_tokens', None)
+        self.prompt_tokens['system'].add(prompt.tokens)
+        self.prompt_tokens['estimated'].add(estimated)
+        if reported:
+            self.prompt_tokens['reported'].add(reported)
+        logger.info(f"Prompt {prompt.version} ({', '.join(prompt.sections)}): ~{prompt.tokens} system tokens "
+                    f"(full prompt ~{FULL_PROMPT_TOKENS}), ~{estimated} in total"
+                    f"{f', {reported} reported' if reported else ''}")
+        return {
+            'version': prompt.version,
+            'sections': prompt.sections,
+            'system_tokens': prompt.tokens,
+            'prompt_tokens': estimated,
+            'reported_prompt_tokens': reported,
+        }
+
+    def _finish(self, parser):
+        """Recover the reply fields from whatever the model produced"""
+        try:
+            result = parser.finish()
+        except ReplyParseError:
+            self.parse_stats.record('failed')
+            raise
+        self.parse_stats.record(result['outcome'])
+        if result['outcome'] != 'clean':
+            logger.warning(f"Recovered LLM reply ({result['outcome']}): {parser.raw[:200]!r}")
+        return result
+
+    @staticmethod
+    def _fallback(response):
+        return {
+            'intent': None,
+            'entities': [],
+            'confidence': 0.0,
+            'response': response
+        }
 
     def process_message(self, input_data):
         if not self.client:
-            return {
-                'intent': None,
-                'entities': [],
-                'confidence': 0.0,
-                'response': "AI service unavailable."
-            }
+            return self._fallback("AI service unavailable.")
+        started = time.monotonic()
         try:
-            model = 'llama3-70b-8192'
-            temperature = 0.5
-            user_message = input_data.get("message", "")
-            conversation_messages = input_data.get("messages", [])
-
-            # Start with the system prompt
-            messages = [{"role": "system", "content": SYSTEM_PROMPTS.strip()}]
-
-            # Add previous messages (context)
-            for msg in conversation_messages:
-                # Ensure each message has the required role property
-                role = 'user' if msg.get('type') == 'user' else 'assistant'
-                messages.append({
-                    'role': role,
-                    'content': msg.get('content', '')
-                })
-
-            # Add current user message
-            messages.append({"role": "user", "content": user_message})
-
+            messages, prompt = self._build_messages(input_data)
+            cached, cache_key = self._cached_reply(input_data, prompt)
+            if cached is not None:
+                return cached
             # Call Groq
             groq_response = self.client.chat.completions.create(
-                model=model,
+                model=self.model,
                 messages=messages,
-                temperature=temperature,
-                max_tokens=512
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
             )
+            parser = StructuredReplyParser()
+            parser.feed(groq_response.choices[0].message.content or '')
+            result = self._finish(parser)
+            result['prompt'] = self._record_prompt(prompt, messages, getattr(groq_response, 'usage', None))
+            if cache_key:
+                self.cache.set(cache_key, input_data.get("message", ""), result)
+            elapsed = time.monotonic() - started
+            self.first_text['blocking'].add(elapsed)
+            self.total['blocking'].add(elapsed)
+            return result
+        except Exception as e:
+            self.errors += 1
+            logger.error(f'Groq API error: {e}')
+            return self._fallback("AI service error.")
 
-            response_text = groq_response.choices[0].message.content.strip()
-            try:
-                return json.loads(response_text)
-            except Exception as e:
-                raise Exception(f"LLM did not return valid JSON: {e}")
+    def stream_message(self, input_data, on_text):
+        """Like ``process_message``, calling ``on_text(delta)`` with response text as it is generated"""
+        if not self.client:
+            return self._fallback("AI service unavailable.")
+        started = time.monotonic()
+        first_token = first_text = None
+        try:
+            messages, prompt = self._build_messages(input_data)
+            cached, cache_key = self._cached_reply(input_data, prompt)
+            if cached is not None:
+                on_text(cached['response'])
+                return cached
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stream=True
+            )
+            parser = StructuredReplyParser()
+            usage = None
+            for chunk in stream:
+                # Groq reports usage on the last chunk
+                x_groq = getattr(chunk, 'x_groq', None)
+                usage = (x_groq.get('usage') if isinstance(x_groq, dict) else getattr(x_groq, 'usage', None)) or usage
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if not token:
+                    continue
+                if first_token is None:
+                    first_token = time.monotonic()
+                    self.first_token.add(first_token - started)
+                delta = parser.feed(token)
+                if delta:
+                    if first_text is None:
+                        first_text = time.monotonic()
+                        self.first_text['streaming'].add(first_text - started)
+                    on_text(delta)
+            result = self._finish(parser)
+            result['prompt'] = self._record_prompt(prompt, messages, usage)
+            if cache_key:
+                self.cache.set(cache_key, input_data.get("message", ""), result)
+            finished = time.monotonic()
+            self.total['streaming'].add(finished - started)
+            logger.info(f"Streamed LLM reply: first text after {((first_text or finished) - started) * 1000:.0f} ms, "
+                        f"done after {(finished - started) * 1000:.0f} ms")
+            return result
         except Exception as e:
+            self.errors += 1
             logger.error(f'Groq API error: {e}')
-            return {
-                'intent': None,
-                'entities': [],
-                'confidence': 0.0,
-                'response': "AI service error."
-            }
+            return self._fallback("AI service error.")
+
+    def summarize(self, summary, messages, max_tokens=300):
+        """Fold ``messages`` into the running conversation ``summary``; None if the call fails"""
+        if not self.client or not messages:
+            return None
+        transcript = "\n".join(
+            f"{'User' if msg.get('type') == 'user' else 'Assistant'}: {msg.get('content', '')}" for msg in messages
+        )
+        try:
+            groq_response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT.strip()},
+                    {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+                ],
+                temperature=0.2,
+                max_tokens=max_tokens
+            )
+            return (groq_response.choices[0].message.content or '').strip() or None
+        except Exception as e:
+            logger.error(f'Groq summary error: {e}')
+            return None
+
+    def metrics(self):
+        return {
+            'time_to_first_text_ms': {mode: stats.snapshot() for mode, stats in self.first_text.items()},
+            'time_to_first_token_ms': self.first_token.snapshot(),
+            'total_ms': {mode: stats.snapshot() for mode, stats in self.total.items()},
+            'reply_parsing': self.parse_stats.snapshot(),
+            'response_cache': self.cache.stats() if self.cache is not None else None,
+            'prompt_tokens': {kind: stats.snapshot(scale=1.0) for kind, stats in self.prompt_tokens.items()},
+            'full_system_prompt_tokens': FULL_PROMPT_TOKENS,
+            'errors': self.errors,
+        }
 
 # Global processor instance
 llm_processor = LLMProcessor()
 
+def _input_data(message, user_id, conversation_id, context):
+    return {
+        'message': message,
+        'user_id': user_id,
+        'conversation_id': conversation_id,
+        'messages': context.get('messages', []),
+        'summary': context.get('summary')
+    }
+
+def _result_fields(result):
+    return {
+        'intent': result.get('intent'),
+        'entities': result.get('entities', []),
+        'confidence': result.get('confidence', 0.0),
+        'response': result.get('response'),
+        'prompt': result.get('prompt'),
+        'cached': result.get('cached', False)
+    }
+
 def process_message_with_llm(message, user_id, conversation_id, context):
     try:
-        input_data = {
-            'message': message,
-            'user_id': user_id,
-            'conversation_id': conversation_id,
-            'messages': context.get('messages', [])
-        }
-        result = llm_processor.process_message(input_data)
-        return {
-            'intent': result.get('intent'),
-            'entities': result.get('entities', []),
-            'confidence': result.get('confidence', 0.0),
-            'response': result.get('response')
-        }
+        result = llm_processor.process_message(_input_data(message, user_id, conversation_id, context))
+        return _result_fields(result)
     except Exception as e:
         logger.error(f"Error processing message with LLM: {e}")
         return None
+
+def stream_message_with_llm(message, user_id, conversation_id, context, on_text):
+    """Streaming ``process_message_with_llm``; ``on_text`` receives response text deltas"""
+    try:
+        result = llm_processor.stream_message(_input_data(message, user_id, conversation_id, context), on_text)
+        return _result_fields(result)
+    except Exception as e:
+        logger.error(f"Error streaming message with LLM: {e}")
+        return None
@@ -0,0 +1,345 @@
+"""NumPy-only inference kernels compiled from fitted sklearn estimators.
+
+Each kernel copies the fitted structure of an estimator into flat arrays and
+evaluates whole batches with vectorized NumPy, skipping sklearn's per-call
+validation and dispatch. Kernels expose the same ``predict`` /
+``predict_proba`` / ``classes_`` / ``n_features_in_`` surface as the
+estimator they replace, so ``DiseasePredictor`` uses them unchanged.
+
+Supported estimators:
+    RandomForestClassifier, ExtraTreesClassifier, DecisionTreeClassifier
+    LogisticRegression
+    SVC (binary; with or without probability estimates)
+    KNeighborsClassifier (brute-force euclidean)
+
+``compile_model`` returns the original estimator for anything else.
+
+Kernels win on single rows and small batches, where sklearn's fixed
+per-call overhead dominates. Tree kernels walk every tree to full depth,
+so past a few hundred rows sklearn's own tree code is faster again;
+``max_batch_rows`` tells ``DiseasePredictor`` where to hand batches back
+to the estimator.
+
+Kernels compiled with ``dtype=np.float32`` store their float arrays (and
+take their inputs) in single precision; index tables stay ``intp``, since
+NumPy would convert narrower indices on every ``take``. Tree thresholds
+are rounded down to float32, which keeps every split decision identical;
+other models drift slightly, so callers should check the result with
+``compare_models`` before serving it.
+"""
+
+import abc
+import logging
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledKernel:
+    """Base class for compiled estimators"""
+
+    # Largest batch the kernel beats the estimator on; None means any size
+    max_batch_rows: Optional[int] = None
+
+    def __init__(self, classes: np.ndarray, n_features: int, dtype: Any = np.float64):
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = int(n_features)
+        self.dtype = np.dtype(dtype)
+
+    def _check_input(self, X: Any) -> np.ndarray:
+        X = np.asarray(X, dtype=self.dtype)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"Expected input of shape (n, {self.n_features_in_}), got {X.shape}"
+            )
+        return X
+
+
+class ProbabilisticKernel(CompiledKernel, abc.ABC):
+    """Kernel whose labels come from the most probable class"""
+
+    @abc.abstractmethod
+    def predict_proba(self, X: Any) -> np.ndarray:
+        """Class probabilities, one row per sample"""
+
+    def predict(self, X: Any) -> np.ndarray:
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+
+class ForestKernel(ProbabilisticKernel):
+    """Tree ensemble flattened into one node table
+
+    All trees are concatenated; leaves point to themselves with an infinite
+    threshold, so every row walks ``max_depth`` steps without branching on
+    leaf status. Leaf values are stored pre-normalized to class
+    probabilities, as sklearn's ``DecisionTreeClassifier.predict_proba``
+    returns them.
+    """
+
+    # Measured crossover with sklearn's forests is 256-512 rows (benchmark.py compiled)
+    max_batch_rows = 256
+
+    def __init__(self, estimator: Any, dtype: Any = np.float64):
+        trees = getattr(estimator, 'estimators_', [estimator])
+        super().__init__(estimator.classes_, estimator.n_features_in_, dtype)
+        n_classes = len(self.classes_)
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for tree in trees:
+            t = tree.tree_
+            node_ids = np.arange(t.node_count)
+            leaf = t.children_left == -1
+            features.append(np.where(leaf, 0, t.feature).astype(np.intp))
+            thresholds.append(np.where(leaf, np.inf, t.threshold))
+            lefts.append(np.where(leaf, node_ids, t.children_left) + offset)
+            rights.append(np.where(leaf, node_ids, t.children_right) + offset)
+            value = t.value[:, 0, :n_classes].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+            roots.append(offset)
+            offset += t.node_count
+            max_depth = max(max_depth, t.max_depth)
+
+        self.feature = np.concatenate(features)
+        self.threshold = np.concatenate(thresholds)
+        if self.dtype == np.float32:
+            # For float32 x, x > t exactly when x > t rounded down to float32
+            rounded = self.threshold.astype(np.float32)
+            self.threshold = np.where(rounded > self.threshold, np.nextafter(rounded, np.float32(-np.inf)), rounded)
+        # children[2 * node + went_right] is the next node
+        self.children = np.column_stack([np.concatenate(lefts), np.concatenate(rights)]).astype(np.intp).ravel()
+        self.value = np.concatenate(values).astype(self.dtype)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+
+    def leaves(self, X: Any) -> np.ndarray:
+        """Leaf index reached in every tree, shape (n_samples, n_trees)"""
+        # sklearn trees compare float32 features against float64 thresholds
+        X = self._check_input(X).astype(np.float32, copy=False)
+        flat = X.ravel()
+        row_offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            went_right = flat.take(row_offsets + self.feature.take(nodes)) > self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + went_right)
+        return nodes
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        leaf_values = self.value[self.leaves(X)]
+        # Accumulate tree by tree, in the same order as sklearn's forest
+        proba = np.zeros((leaf_values.shape[0], leaf_values.shape[2]), dtype=self.dtype)
+        for t in range(leaf_values.shape[1]):
+            proba += leaf_values[:, t]
+        if len(self.roots) > 1:
+            proba /= len(self.roots)
+        return proba
+
+
+class LogisticKernel(ProbabilisticKernel):
+    """Logistic regression (binary, one-vs-rest or multinomial)"""
+
+    def __init__(self, estimator: Any, dtype: Any = np.float64):
+        super().__init__(estimator.classes_, estimator.n_features_in_, dtype)
+        self.coef = np.ascontiguousarray(estimator.coef_.T, dtype=self.dtype)
+        self.intercept = np.asarray(estimator.intercept_, dtype=self.dtype)
+        multi_class = getattr(estimator, 'multi_class', 'auto')
+        self.ovr = multi_class in ('ovr', 'warn') or (
+            multi_class == 'auto' and (len(self.classes_) <= 2 or estimator.solver == 'liblinear')
+        )
+
+    def decision_function(self, X: Any) -> np.ndarray:
+        scores = self._check_input(X) @ self.coef + self.intercept
+        return scores.ravel() if scores.shape[1] == 1 else scores
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        scores = self.decision_function(X)
+        if scores.ndim == 1:
+            if self.ovr:
+                positive = 1.0 / (1.0 + np.exp(-scores))
+                return np.column_stack([1 - positive, positive])
+            scores = np.column_stack([-scores, scores])
+        elif self.ovr:
+            proba = 1.0 / (1.0 + np.exp(-scores))
+            return proba / proba.sum(axis=1, keepdims=True)
+        scores = scores - scores.max(axis=1, keepdims=True)
+        proba = np.exp(scores)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+
+class SVCKernel(CompiledKernel):
+    """Binary SVC without probability estimates"""
+
+    def __init__(self, estimator: Any, dtype: Any = np.float64):
+        super().__init__(estimator.classes_, estimator.n_features_in_, dtype)
+        self.kernel = estimator.kernel
+        self.gamma = float(estimator._gamma)
+        self.coef0 = float(estimator.coef0)
+        self.degree = int(estimator.degree)
+        self.support_vectors = np.ascontiguousarray(estimator.support_vectors_, dtype=self.dtype)
+        # Public dual_coef_/intercept_ are sign-flipped so positive means classes_[1]
+        self.dual_coef = np.asarray(estimator.dual_coef_, dtype=self.dtype).ravel()
+        self.intercept = float(np.asarray(estimator.intercept_).ravel()[0])
+        self.sv_norms = (self.support_vectors ** 2).sum(axis=1)
+        # A linear kernel collapses to a single weight vector
+        self.weights = self.dual_coef @ self.support_vectors if self.kernel == 'linear' else None
+
+    def _gram(self, X: np.ndarray) -> np.ndarray:
+        dot = X @ self.support_vectors.T
+        if self.kernel == 'linear':
+            return dot
+        if self.kernel == 'rbf':
+            sq_dist = (X ** 2).sum(axis=1)[:, None] - 2 * dot + self.sv_norms
+            return np.exp(-self.gamma * np.maximum(sq_dist, 0))
+        if self.kernel == 'poly':
+            return (self.gamma * dot + self.coef0) ** self.degree
+        return np.tanh(self.gamma * dot + self.coef0)
+
+    def decision_function(self, X: Any) -> np.ndarray:
+        X = self._check_input(X)
+        if self.weights is not None:
+            return X @ self.weights + self.intercept
+        return self._gram(X) @ self.dual_coef + self.intercept
+
+    def predict(self, X: Any) -> np.ndarray:
+        return self.classes_.take((self.decision_function(X) >= 0).astype(np.intp))
+
+
+class ProbabilisticSVCKernel(SVCKernel, ProbabilisticKernel):
+    """Binary SVC with libsvm's Platt-scaled probability estimates"""
+
+    MIN_PROB = 1e-7
+
+    def __init__(self, estimator: Any, dtype: Any = np.float64):
+        super().__init__(estimator, dtype)
+        self.prob_a = float(np.ravel(estimator.probA_)[0])
+        self.prob_b = float(np.ravel(estimator.probB_)[0])
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        # libsvm's decision value has the opposite sign of the public one
+        f = -self.decision_function(X).astype(np.float64) * self.prob_a + self.prob_b
+        pairwise = np.clip(1.0 / (1.0 + np.exp(f)), self.MIN_PROB, 1 - self.MIN_PROB)
+        return self._couple(pairwise)
+
+    @staticmethod
+    def _couple(r: np.ndarray) -> np.ndarray:
+        """libsvm's multiclass_probability for two classes, vectorized over rows
+
+        sklearn's bundled libsvm runs the iterative pairwise-coupling solver
+        even for binary problems, so the result is not exactly ``[r, 1 - r]``.
+        """
+        k = 2
+        q = np.empty((len(r), k, k))
+        q[:, 0, 0] = (1 - r) ** 2
+        q[:, 1, 1] = r ** 2
+        q[:, 0, 1] = q[:, 1, 0] = -r * (1 - r)
+        p = np.full((len(r), k), 1.0 / k)
+        qp = np.einsum('nij,nj->ni', q, p)
+        pqp = (p * qp).sum(axis=1)
+        active = np.ones(len(r), dtype=bool)
+        for _ in range(max(100, k)):
+            active &= np.abs(qp - pqp[:, None]).max(axis=1) >= 0.005 / k
+            if not active.any():
+                break
+            for t in range(k):
+                diff = np.where(active, (-qp[:, t] + pqp) / q[:, t, t], 0.0)
+                p[:, t] += diff
+                pqp = (pqp + diff * (diff * q[:, t, t] + 2 * qp[:, t])) / (1 + diff) / (1 + diff)
+                qp = (qp + diff[:, None] * q[:, t, :]) / (1 + diff[:, None])
+                p /= (1 + diff[:, None])
+        return p
+
+    def predict(self, X: Any) -> np.ndarray:
+        # Like sklearn, labels come from the decision function, not the probabilities
+        return SVCKernel.predict(self, X)
+
+
+class KNeighborsKernel(ProbabilisticKernel):
+    """Brute-force euclidean k-nearest-neighbours classifier"""
+
+    def __init__(self, estimator: Any, dtype: Any = np.float64):
+        super().__init__(estimator.classes_, estimator.n_features_in_, dtype)
+        self.fit_X = np.ascontiguousarray(estimator._fit_X, dtype=self.dtype)
+        self.fit_norms = (self.fit_X ** 2).sum(axis=1)
+        self.labels = np.asarray(estimator._y, dtype=np.intp)
+        self.n_neighbors = int(estimator.n_neighbors)
+        self.weights = estimator.weights
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        X = self._check_input(X)
+        sq_dist = (X ** 2).sum(axis=1)[:, None] - 2 * X @ self.fit_X.T + self.fit_norms
+        sq_dist = np.maximum(sq_dist, 0)
+        k = self.n_neighbors
+        nearest = np.argpartition(sq_dist, k - 1, axis=1)[:, :k]
+        rows = np.arange(len(X))[:, None]
+        if self.weights == 'distance':
+            dist = np.sqrt(sq_dist[rows, nearest])
+            with np.errstate(divide='ignore'):
+                weights = 1.0 / dist
+            exact = np.isinf(weights)
+            weights = np.where(exact.any(axis=1, keepdims=True), exact.astype(float), weights)
+        else:
+            weights = np.ones(nearest.shape)
+        proba = np.zeros((len(X), len(self.classes_)))
+        np.add.at(proba, (np.broadcast_to(rows, nearest.shape), self.labels[nearest]), weights)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+
+def _compiler_for(model: Any):
+    """Kernel class for a fitted estimator, or None if unsupported"""
+    try:
+        from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.neighbors import KNeighborsClassifier
+        from sklearn.svm import SVC
+        from sklearn.tree import DecisionTreeClassifier
+    except ImportError:
+        return None
+
+    if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier, DecisionTreeClassifier)):
+        return ForestKernel if getattr(model, 'n_outputs_', 1) == 1 else None
+    if isinstance(model, LogisticRegression):
+        return LogisticKernel
+    if isinstance(model, SVC) and len(model.classes_) == 2 and model.kernel in ('linear', 'rbf', 'poly', 'sigmoid'):
+        return ProbabilisticSVCKernel if hasattr(model, 'predict_proba') else SVCKernel
+    if isinstance(model, KNeighborsClassifier) and model.weights in ('uniform', 'distance') and (
+        model.effective_metric_ == 'euclidean'
+    ):
+        return KNeighborsKernel
+    return None
+
+
+def compile_model(model: Any, dtype: Any = np.float64) -> Any:
+    """Compile a fitted estimator to a NumPy kernel, or return it unchanged"""
+    if isinstance(model, CompiledKernel) and model.dtype == np.dtype(dtype):
+        return model
+    compiler = _compiler_for(model)
+    if compiler is None:
+        logger.info(f"No compiled kernel for {type(model).__name__}; using the estimator")
+        return model
+    try:
+        return compiler(model, dtype)
+    except Exception as e:
+        logger.warning(f"Failed to compile {type(model).__name__}, using the estimator: {e}")
+        return model
+
+
+def confidences(model: Any, X: np.ndarray) -> np.ndarray:
+    """Confidence in percent as DiseasePredictor reports it"""
+    if hasattr(model, 'predict_proba'):
+        return model.predict_proba(X).max(axis=1) * 100
+    return np.full(len(X), 100.0)
+
+
+def compare_models(reference: Any, candidate: Any, X: np.ndarray) -> Dict[str, Any]:
+    """Label mismatches and largest confidence drift of ``candidate`` on ``X``"""
+    drift = np.abs(confidences(candidate, X).astype(np.float64) - confidences(reference, X))
+    return {
+        'rows': len(X),
+        'label_mismatches': int((candidate.predict(X) != reference.predict(X)).sum()),
+        'max_confidence_drift': float(drift.max()) if len(drift) else 0.0,
+    }
@@ -14,7 +14,79 @@ class Config:
     
     # Groq configuration
     GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
+    # Groq-compatible endpoint override, e.g. fake_llm_server.py for local testing
+    GROQ_BASE_URL = os.environ.get('GROQ_BASE_URL', '')
+    # Stream chat replies to the client token by token
+    LLM_STREAMING = os.environ.get('LLM_STREAMING', 'True') == 'True'
+    # Send only the system prompt sections for the current intent (False sends the whole prompt)
+    LLM_SCOPED_PROMPT = os.environ.get('LLM_SCOPED_PROMPT', 'True') == 'True'
+    # Conversation history sent to the LLM: newest messages within the token budget,
+    # older ones folded into a rolling summary once they add up to CONTEXT_SUMMARY_BATCH tokens
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '1500'))
+    CONTEXT_SUMMARY_TOKENS = int(os.environ.get('CONTEXT_SUMMARY_TOKENS', '300'))
+    CONTEXT_SUMMARY_BATCH = int(os.environ.get('CONTEXT_SUMMARY_BATCH', '200'))
     
     # Other configuration
     DEBUG = os.environ.get('DEBUG', 'False') == 'True'
     PORT = int(os.environ.get('PORT', '5000'))
+
+    # Prediction configuration
+    PREDICTION_BATCH_LIMIT = int(os.environ.get('PREDICTION_BATCH_LIMIT', '1000'))
+    # Cap on estimated memory of loaded models per worker; 0 disables eviction
+    MODEL_MEMORY_LIMIT_MB = int(os.environ.get('MODEL_MEMORY_LIMIT_MB', '0'))
+    # Directory of memory-mapped artifacts (see model_store.py); empty uses the pickles
+    MODEL_ARTIFACT_DIR = os.environ.get('MODEL_ARTIFACT_DIR', '')
+    # 'compiled' swaps supported estimators for NumPy kernels on single rows and small
+    # batches; larger batches stay on the estimator (see compiled_models.py)
+    MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'sklearn')
+    # Models to load and warm up before reporting ready: comma-separated diseases or 'all'.
+    # Empty loads each model on first use; warm-up also stops at MODEL_MEMORY_LIMIT_MB
+    MODEL_WARMUP = os.environ.get('MODEL_WARMUP', '')
+    # 'float32' serves single-precision kernels that pass an accuracy check
+    MODEL_PRECISION = os.environ.get('MODEL_PRECISION', 'float64')
+    # Largest confidence drift (percentage points) allowed for float32 models
+    PRECISION_TOLERANCE = float(os.environ.get('PRECISION_TOLERANCE', '0.1'))
+    # Seconds between checks for replaced model files
+    MODEL_CHECK_INTERVAL = float(os.environ.get('MODEL_CHECK_INTERVAL', '5'))
+    # Swap in new model versions without a restart (see ModelRegistry)
+    MODEL_HOT_RELOAD = os.environ.get('MODEL_HOT_RELOAD', 'True') == 'True'
+    # Optional JSON manifest of {disease: {"path": ..., "version": ...}}
+    MODEL_MANIFEST = os.environ.get('MODEL_MANIFEST', '')
+
+    # Inference executor: 'thread', 'process' or 'inline' (see inference.py)
+    INFERENCE_EXECUTOR = os.environ.get('INFERENCE_EXECUTOR', 'thread')
+    INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '2'))
+    INFERENCE_MAX_QUEUE = int(os.environ.get('INFERENCE_MAX_QUEUE', '64'))
+    INFERENCE_TIMEOUT = float(os.environ.get('INFERENCE_TIMEOUT', '10'))
+    # Unix socket of a shared inference sidecar (see inference_server.py); empty predicts in-process
+    INFERENCE_SIDECAR = os.environ.get('INFERENCE_SIDECAR', '')
+    INFERENCE_SIDECAR_RETRY = float(os.environ.get('INFERENCE_SIDECAR_RETRY', '5'))
+    # Micro-batching of concurrent predicts per disease; window 0 disables it
+    MICROBATCH_WINDOW_MS = float(os.environ.get('MICROBATCH_WINDOW_MS', '5'))
+    MICROBATCH_MAX_SIZE = int(os.environ.get('MICROBATCH_MAX_SIZE', '32'))
+
+    # Score complete predictions in the background before the user asks
+    SPECULATIVE_SCORING = os.environ.get('SPECULATIVE_SCORING', 'True') == 'True'
+    SPECULATIVE_TTL = float(os.environ.get('SPECULATIVE_TTL', '600'))
+
+    # Prediction result cache; size 0 disables it
+    PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', '4096'))
+    PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', '3600'))
+    # What-if sensitivity grids (see sensitivity.py)
+    SENSITIVITY_CACHE_SIZE = int(os.environ.get('SENSITIVITY_CACHE_SIZE', '256'))
+    SENSITIVITY_MAX_STEPS = int(os.environ.get('SENSITIVITY_MAX_STEPS', '50'))
+    # Reference-population percentile tables built by percentiles.py
+    PERCENTILE_TABLES = os.environ.get('PERCENTILE_TABLES', 'models/percentiles.npz')
+    # LLM reply cache for repeated questions; size 0 disables it. Replies are shared across
+    # users, so only conversations with no summary and at most LLM_CACHE_CONTEXT_MESSAGES
+    # earlier messages use it. Messages with a skipped intent (or whose reply has one) are
+    # never served from or stored in the cache
+    LLM_CACHE_SIZE = int(os.environ.get('LLM_CACHE_SIZE', '1024'))
+    LLM_CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL', '86400'))
+    LLM_CACHE_CONTEXT_MESSAGES = int(os.environ.get('LLM_CACHE_CONTEXT_MESSAGES', '2'))
+    LLM_CACHE_SKIP_INTENTS = os.environ.get(
+        'LLM_CACHE_SKIP_INTENTS',
+        'parameter_entry,prediction_result,disease_prediction,emergency,symptom_analysis,mental_health'
+    )
+    # Optional Redis URL for caches shared between workers
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', '')
@@ -2,10 +2,27 @@ from datetime import datetime, timedelta
 from pytz import timezone
 import logging
 import threading
+from config import Config
+from thread_pools import waiting_thread_pool
+from token_counter import estimate_tokens, message_tokens
 
 IST = timezone('Asia/Kolkata')
 logger = logging.getLogger(__name__)
 
+def select_window(messages, budget):
+    """Index of the oldest message in the newest-first run that fits ``budget`` tokens
+
+    The newest message is always kept, even if it alone exceeds the budget.
+    """
+    used = 0
+    start = len(messages)
+    for index in range(len(messages) - 1, -1, -1):
+        used += message_tokens(messages[index])
+        if used > budget and start < len(messages):
+            break
+        start = index
+    return start
+
 class ContextTracker:
     _instance = None
     _lock = threading.Lock()
@@ -15,17 +32,22 @@ class ContextTracker:
             if cls._instance is None:
                 cls._instance = super(ContextTracker, cls).__new__(cls)
                 cls._instance.db_manager = None
+                cls._instance.summarizer = None
+                cls._instance._summary_pool = None
+                cls._instance._refreshing = set()
+                cls._instance.summary_stats = {'scheduled': 0, 'refreshed': 0, 'failed': 0, 'superseded': 0}
         return cls._instance
 
     def __init__(self):
         pass
 
     @classmethod
-    def initialize(cls, db_manager):
-        """Initialize with database manager"""
+    def initialize(cls, db_manager, summarizer=None):
+        """Initialize with database manager and an optional ``summarizer(summary, messages, max_tokens)``"""
         if cls._instance is None:
             cls._instance = cls()
         cls._instance.db_manager = db_manager
+        cls._instance.summarizer = summarizer
         return cls._instance
 
     def _handle_error(self, func_name, e):
@@ -150,8 +172,8 @@ class ContextTracker:
         except Exception as e:
             self._handle_error('get_user_history', e)
 
-    def get_or_create_context(self, user_id, conversation_id=None, limit=10):
-        """Get or create conversation context, limiting to last N messages by default."""
+    def get_or_create_context(self, user_id, conversation_id=None, limit=None):
+        """Get or create conversation context within the configured token budget."""
         try:
             if not conversation_id:
                 conversation = self.db_manager.create_conversation(user_id)
@@ -162,14 +184,39 @@ class ContextTracker:
         except Exception as e:
             self._handle_error('get_or_create_context', e)
 
-    def get_context(self, user_id, conversation_id, limit=10):
-        """Return conversation context for LLM and chat processing, limited to last N messages."""
+    def get_context(self, user_id, conversation_id, limit=None, budget=None):
+        """Return conversation context for LLM and chat processing.
+
+        Holds the newest messages that fit the token budget (at most ``limit``
+        of them if given) and the rolling summary of older ones. Messages that
+        fall out of the window unsummarized are folded into the summary in
+        the background once they reach CONTEXT_SUMMARY_BATCH tokens.
+        """
         try:
-            messages = self.get_conversation_messages(conversation_id)
-            if limit is not None and len(messages) > limit:
-                messages = messages[-limit:]
+            budget = budget or Config.CONTEXT_TOKEN_BUDGET
+            conversation = self.db_manager.get_conversation_context(conversation_id)
+            messages = conversation.get('messages') or []
+            summary = conversation.get('summary') or {}
+            covered = summary.get('covered', 0)
+
+            summary_text = summary.get('text') if covered else None
+            start = self._window_start(messages, budget)
+            if summary_text:
+                # Never repeat verbatim what the summary already covers
+                start = max(start, covered)
+            if limit is not None:
+                start = max(start, len(messages) - limit)
+            if start > covered and sum(message_tokens(m) for m in messages[covered:start]) >= Config.CONTEXT_SUMMARY_BATCH:
+                self._schedule_summary(conversation_id)
+
+            window = messages[start:]
+            for message in window:
+                if 'timestamp' in message and isinstance(message['timestamp'], datetime):
+                    message['timestamp'] = message['timestamp'].isoformat()
             return {
-                'messages': messages,
+                'messages': window,
+                'summary': summary_text,
+                'tokens': estimate_tokens(summary_text or '') + sum(message_tokens(m) for m in window),
                 'conversation_id': conversation_id,
                 'user_id': user_id
             }
@@ -177,6 +224,61 @@ class ContextTracker:
             self._handle_error('get_context', e)
             return {'messages': [], 'conversation_id': conversation_id, 'user_id': user_id}
 
+    @staticmethod
+    def _window_start(messages, budget):
+        """First message of the context window, leaving room for a summary at its maximum length
+
+        get_context and refresh_summary both cut here, so the summary ends
+        exactly where the window begins.
+        """
+        return select_window(messages, budget - Config.CONTEXT_SUMMARY_TOKENS)
+
+    def _schedule_summary(self, conversation_id):
+        """Refresh a conversation's summary off the request path, once at a time per conversation"""
+        if self.summarizer is None:
+            return
+        with self._lock:
+            if conversation_id in self._refreshing:
+                return
+            self._refreshing.add(conversation_id)
+            if self._summary_pool is None:
+                self._summary_pool = waiting_thread_pool(1, 'summary')
+            self.summary_stats['scheduled'] += 1
+        self._summary_pool.submit(self.refresh_summary, conversation_id)
+
+    def refresh_summary(self, conversation_id, budget=None):
+        """Fold messages that fell out of the context window into the stored summary"""
+        try:
+            budget = budget or Config.CONTEXT_TOKEN_BUDGET
+            conversation = self.db_manager.get_conversation_context(conversation_id)
+            messages = conversation.get('messages') or []
+            summary = conversation.get('summary') or {}
+            covered = summary.get('covered', 0)
+            start = self._window_start(messages, budget)
+            if start <= covered:
+                return False
+
+            text = self.summarizer(summary.get('text'), messages[covered:start], Config.CONTEXT_SUMMARY_TOKENS)
+            if not text:
+                self.summary_stats['failed'] += 1
+                return False
+            stored = self.db_manager.update_conversation_summary(conversation_id, {
+                'text': text,
+                'covered': start,
+                'tokens': estimate_tokens(text),
+                'updated_at': datetime.now(IST).isoformat()
+            }, covered)
+            self.summary_stats['refreshed' if stored else 'superseded'] += 1
+            if stored:
+                logger.info(f"Summarized messages {covered}-{start} of conversation {conversation_id}")
+            return stored
+        except Exception as e:
+            self.summary_stats['failed'] += 1
+            logger.error(f"Error refreshing summary for {conversation_id}: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._refreshing.discard(conversation_id)
 
     def create_context(self, user_id, conversation_id=None):
         """Create new conversation context"""
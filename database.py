@@ -4,7 +4,7 @@ import os
 import logging
 from datetime import datetime
 from bson.objectid import ObjectId
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -112,6 +112,32 @@ class DatabaseManager:
             logger.error(f"Error getting messages: {e}")
             return []
 
+    def get_conversation_context(self, conversation_id):
+        """Get conversation messages and rolling summary."""
+        try:
+            conversation = self.conversations.find_one(
+                {'_id': ObjectId(conversation_id)},
+                {'messages': 1, 'summary': 1}
+            )
+            return conversation or {}
+        except Exception as e:
+            logger.error(f"Error getting conversation context: {e}")
+            return {}
+
+    def update_conversation_summary(self, conversation_id, summary, previous_covered):
+        """Store a rolling summary unless another refresh already replaced the one it extends."""
+        try:
+            query = {'_id': ObjectId(conversation_id)}
+            if previous_covered:
+                query['summary.covered'] = previous_covered
+            else:
+                query['summary'] = {'$exists': False}
+            result = self.conversations.update_one(query, {'$set': {'summary': summary}})
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error updating conversation summary: {e}")
+            return False
+
     def update_message_metadata(self, conversation_id, message_index, metadata):
         """Update message metadata."""
         try:
@@ -248,6 +274,43 @@ class DatabaseManager:
             return None
     
     
+    def get_predictions_by_ids(self, prediction_ids, user_id=None):
+        """Get several predictions in one query, optionally restricted to a user.
+
+        Malformed ids are skipped, so callers see them as not found.
+        """
+        try:
+            object_ids = [ObjectId(pid) for pid in prediction_ids if ObjectId.is_valid(pid)]
+            if not object_ids:
+                return []
+            query = {'_id': {'$in': object_ids}}
+            if user_id:
+                query['user_id'] = user_id
+            return list(self.predictions.find(query))
+        except Exception as e:
+            logger.error(f"Error getting predictions: {e}")
+            return []
+
+    def bulk_update_predictions(self, updates):
+        """
+        Apply many prediction updates in one round-trip.
+        Args:
+            updates: iterable of (prediction_id, update_data) pairs
+        Returns:
+            Number of modified predictions
+        """
+        try:
+            operations = [
+                UpdateOne({'_id': ObjectId(prediction_id)}, {'$set': update_data})
+                for prediction_id, update_data in updates
+            ]
+            if not operations:
+                return 0
+            return self.predictions.bulk_write(operations, ordered=False).modified_count
+        except Exception as e:
+            logger.error(f"Error bulk updating predictions: {e}")
+            return 0
+
     def get_user_predictions(self, user_id):
         """Get user predictions."""
         try:
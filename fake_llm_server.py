@@ -0,0 +1,144 @@
+"""Local stand-in for the Groq chat completions API, for testing chat latency.
+
+Usage:
+    python fake_llm_server.py [--port 8089] [--first-token-ms 400] [--token-ms 25]
+        [--malformed-rate 0.0]
+
+Then run the app with GROQ_BASE_URL=http://127.0.0.1:8089 and any
+GROQ_API_KEY. Replies are the structured JSON the system prompt asks for,
+echoing the last user message, and are sent word by word as server-sent
+events when ``stream`` is set (or all at once after the full generation
+time otherwise), so streaming and blocking modes can be compared.
+With --malformed-rate, that share of replies is fenced, given a trailing
+comma or cut off, to exercise the reply recovery in llm_json.py.
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATH = '/openai/v1/chat/completions'
+
+
+def build_reply(messages):
+    user_message = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+    return json.dumps({
+        'intent': 'general_consultation',
+        'entities': [],
+        'confidence': 0.9,
+        'response': (f'Thanks for your message: "{user_message[:200]}". This is a simulated reply from the '
+                     'local test server, streamed one word at a time so the chat client can render it as '
+                     'it arrives. Please consult a healthcare professional for medical advice.'),
+    })
+
+
+def malform(reply):
+    """One of the ways real replies go slightly wrong"""
+    kind = random.choice(['fence', 'trailing_comma', 'truncate'])
+    if kind == 'fence':
+        return f'```json\n{reply}\n```'
+    if kind == 'trailing_comma':
+        return reply[:-1] + ',}'
+    return reply[:int(len(reply) * 0.8)]
+
+
+def tokenize(text):
+    """Roughly word-sized pieces that join back into ``text``"""
+    return re.findall(r'\s*\S+', text)
+
+
+class FakeCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != COMPLETIONS_PATH:
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        reply = build_reply(body.get('messages', []))
+        if random.random() < self.server.malformed_rate:
+            reply = malform(reply)
+        tokens = tokenize(reply)
+        tokens = tokens[:body.get('max_tokens') or len(tokens)]
+        prompt_tokens = sum(len(tokenize(m.get('content', ''))) for m in body.get('messages', []))
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(tokens),
+                 'total_tokens': prompt_tokens + len(tokens)}
+        base = {'id': f'chatcmpl-{uuid.uuid4().hex[:12]}', 'created': int(time.time()),
+                'model': body.get('model', 'fake'), 'system_fingerprint': 'fake'}
+
+        time.sleep(self.server.first_token)
+        if not body.get('stream'):
+            time.sleep(self.server.per_token * len(tokens))
+            self._send_json(dict(base, object='chat.completion', usage=usage, choices=[{
+                'index': 0, 'finish_reason': 'stop', 'logprobs': None,
+                'message': {'role': 'assistant', 'content': ''.join(tokens)},
+            }]))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.server.per_token)
+            self._send_event(dict(base, object='chat.completion.chunk', choices=[{
+                'index': 0, 'finish_reason': None, 'logprobs': None,
+                'delta': {'role': 'assistant', 'content': token},
+            }]))
+        self._send_event(dict(base, object='chat.completion.chunk', x_groq={'usage': usage}, choices=[{
+            'index': 0, 'finish_reason': 'stop', 'logprobs': None, 'delta': {'role': 'assistant', 'content': ''},
+        }]))
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, payload):
+        self.wfile.write(f'data: {json.dumps(payload)}\n\n'.encode())
+        self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--first-token-ms', type=float, default=400, help='delay before the first token')
+    parser.add_argument('--token-ms', type=float, default=25, help='delay between tokens')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='share of replies to malform')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), FakeCompletionsHandler)
+    server.first_token = args.first_token_ms / 1000.0
+    server.per_token = args.token_ms / 1000.0
+    server.verbose = args.verbose
+    server.malformed_rate = args.malformed_rate
+    print(f"Fake LLM server on http://{args.host}:{args.port} "
+          f"(first token {args.first_token_ms:.0f} ms, {args.token_ms:.0f} ms/token)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,534 @@
+"""Inference executor that keeps CPU-bound predictions off the Socket.IO loop.
+
+Socket handlers and HTTP routes submit predictions here instead of calling
+``DiseasePredictor`` directly. Work runs either on a pool of native threads
+(cooperative with gevent when it is monkey-patched) or on a process pool
+whose workers preload the models. The number of queued plus running tasks is
+bounded, each task has a timeout, and the time spent waiting in the queue is
+tracked separately from compute time. Concurrent single predictions for the
+same disease can be coalesced into one batched model call (MicroBatcher),
+and a prediction whose parameters are complete can be scored ahead of the
+user's request (SpeculativeScorer).
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache import PredictionCache, TTLCache, to_python
+from config import Config
+from metrics import RollingStats
+from inference_server import sidecar_client
+from models import DISEASE_PREDICTORS, PredictionError, get_predictor, prepare_features
+from thread_pools import native_thread_pool, waiting_thread_pool
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBusyError(PredictionError):
+    """Raised when the executor queue is full"""
+    pass
+
+
+class InferenceTimeoutError(PredictionError):
+    """Raised when a prediction does not finish in time"""
+    pass
+
+
+def warm_up_diseases() -> List[str]:
+    """Diseases named by MODEL_WARMUP, with 'all' meaning every model"""
+    names = [name.strip() for name in Config.MODEL_WARMUP.split(',') if name.strip()]
+    if 'all' in names:
+        return list(DISEASE_PREDICTORS)
+    unknown = [name for name in names if name not in DISEASE_PREDICTORS]
+    if unknown:
+        logger.warning(f"MODEL_WARMUP names unknown diseases: {', '.join(unknown)}")
+    return [name for name in names if name in DISEASE_PREDICTORS]
+
+
+def _preload_models():
+    """Process-pool initializer: warm up the MODEL_WARMUP models once per worker process"""
+    diseases = warm_up_diseases()
+    if diseases:
+        DISEASE_PREDICTORS.warm_up(diseases)
+
+
+def _warm_up_worker(diseases: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Pool task that waits for a worker's initializer and reports its models"""
+    return DISEASE_PREDICTORS.warm_up(diseases)
+
+
+def _execute(disease: str, method: str, payload: Any) -> Tuple[Any, str, float, float]:
+    """Run a predictor method and report the model version, start and finish
+
+    ``time.monotonic`` is system-wide on Linux, so timestamps taken in a
+    pool process are comparable with the submitting process.
+    """
+    started = time.monotonic()
+    predictor = get_predictor(disease)
+    if predictor is None:
+        raise PredictionError(f"No predictor found for {disease}")
+    result = getattr(predictor, method)(payload)
+    return result, predictor.version, started, time.monotonic()
+
+
+class _PendingBatch:
+    """Requests for one disease waiting to be scored together"""
+
+    def __init__(self):
+        self.rows: List[List[float]] = []
+        self.futures: List[Future] = []
+        self.full = threading.Event()
+
+
+class MicroBatcher:
+    """Coalesces concurrent single predictions for a disease into one batch
+
+    The first request of a batch becomes its leader. If no batch of the same
+    disease is running, the leader flushes at once, so an idle worker adds no
+    latency. Otherwise it waits up to ``window`` seconds, or until
+    ``max_batch_size`` requests have joined, then scores everyone with a
+    single ``predict_batch`` call and hands each caller its own row.
+    """
+
+    def __init__(self, executor: 'InferenceExecutor', window: float = 0.005, max_batch_size: int = 32):
+        self.executor = executor
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._running: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.batch_size = RollingStats()
+        self.window_wait = RollingStats()
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, disease: str, features: List[float], timeout: Optional[float] = None) -> Tuple[Any, float]:
+        future = Future()
+        with self._lock:
+            self.requests += 1
+            batch = self._pending.get(disease)
+            if batch is None:
+                batch = self._pending[disease] = _PendingBatch()
+            batch.rows.append(features)
+            batch.futures.append(future)
+            leader = len(batch.rows) == 1
+            if len(batch.rows) >= self.max_batch_size:
+                # Later requests start a new batch
+                del self._pending[disease]
+                batch.full.set()
+            busy = self._running.get(disease, 0) > 0
+
+        if leader:
+            waited = time.monotonic()
+            if busy:
+                batch.full.wait(self.window)
+            with self._lock:
+                if self._pending.get(disease) is batch:
+                    del self._pending[disease]
+                self._running[disease] = self._running.get(disease, 0) + 1
+            self.window_wait.add(time.monotonic() - waited)
+            try:
+                self._flush(disease, batch, timeout)
+            finally:
+                with self._lock:
+                    self._running[disease] -= 1
+        return future.result(timeout=timeout or self.executor.timeout)
+
+    def _flush(self, disease: str, batch: _PendingBatch, timeout: Optional[float]):
+        self.batches += 1
+        self.batch_size.add(len(batch.rows))
+        try:
+            (labels, confidences), version = self.executor.run(disease, 'predict_batch', np.array(batch.rows), timeout)
+        except Exception as e:
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+        for future, label, confidence in zip(batch.futures, labels.tolist(), confidences.tolist()):
+            future.set_result((label, confidence, version))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'window_ms': self.window * 1000,
+            'max_batch_size': self.max_batch_size,
+            'requests': self.requests,
+            'batches': self.batches,
+            'batch_size': self.batch_size.snapshot(scale=1.0),
+            'window_wait_ms': self.window_wait.snapshot(),
+        }
+
+
+class InferenceExecutor:
+    """Bounded pool that runs ``DiseasePredictor`` calls off the event loop
+
+    ``mode`` is ``'thread'``, ``'process'`` or ``'inline'`` (run in the
+    caller, useful for tests and scripts).
+    """
+
+    def __init__(self, mode: str = 'thread', max_workers: int = 2, max_queue: int = 64,
+                 timeout: float = 10.0, cache: Optional[PredictionCache] = None,
+                 batch_window: float = 0.0, max_batch_size: int = 32):
+        self.mode = mode
+        self.cache = cache
+        self.batcher = MicroBatcher(self, batch_window, max_batch_size) if batch_window > 0 else None
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.queue_wait = RollingStats()
+        self.compute = RollingStats()
+        self.rejected = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.ready = threading.Event()
+        self.warm_up_report: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_config(cls) -> 'InferenceExecutor':
+        return cls(
+            mode=Config.INFERENCE_EXECUTOR,
+            max_workers=Config.INFERENCE_WORKERS,
+            max_queue=Config.INFERENCE_MAX_QUEUE,
+            timeout=Config.INFERENCE_TIMEOUT,
+            cache=PredictionCache.from_config(),
+            batch_window=Config.MICROBATCH_WINDOW_MS / 1000.0,
+            max_batch_size=Config.MICROBATCH_MAX_SIZE,
+        )
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                if self.mode == 'process':
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_preload_models)
+                else:
+                    # Room for a whole multi-disease screening at once (predict_many)
+                    self._pool = native_thread_pool(max(self.max_workers, len(DISEASE_PREDICTORS)), 'inference')
+            return self._pool
+
+    def run(self, disease: str, method: str, payload: Any, timeout: Optional[float] = None) -> Tuple[Any, str]:
+        """Run ``predictor.<method>(payload)`` and wait for the result and model version"""
+        if self.mode != 'inline':
+            future, submitted = self._submit(disease, method, payload)
+            return self._collect(disease, future, submitted, timeout)
+        self._take_slot(disease)
+        future = Future()
+        submitted = time.monotonic()
+        try:
+            future.set_result(_execute(disease, method, payload))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._slots.release()
+        return self._collect(disease, future, submitted, timeout)
+
+    def _take_slot(self, disease: str):
+        if disease not in DISEASE_PREDICTORS:
+            raise PredictionError(f"No predictor found for {disease}")
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise InferenceBusyError("Inference queue is full, please retry shortly")
+
+    def _submit(self, disease: str, method: str, payload: Any) -> Tuple[Future, float]:
+        """Start ``predictor.<method>(payload)`` on the pool without waiting for it"""
+        self._take_slot(disease)
+        try:
+            future = self._get_pool().submit(_execute, disease, method, payload)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Hold the slot until the task ends, not until the caller gives up
+        # waiting, so work that outlives its timeout still counts
+        future.add_done_callback(lambda _: self._slots.release())
+        return future, time.monotonic()
+
+    def _collect(self, disease: str, future: Future, submitted: float,
+                 timeout: Optional[float] = None) -> Tuple[Any, str]:
+        """Wait for a submitted task and record its queue and compute time"""
+        try:
+            try:
+                result, version, started, finished = future.result(timeout=timeout or self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                self.timeouts += 1
+                raise InferenceTimeoutError(f"{disease} prediction timed out")
+            self.queue_wait.add(max(started - submitted, 0.0))
+            self.compute.add(finished - started)
+            return result, version
+        except PredictionError:
+            self.failures += 1
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Inference error for {disease}: {e}")
+            raise PredictionError(f"Failed to make prediction: {str(e)}")
+
+    def warm_up(self, diseases: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Warm up the MODEL_WARMUP models (or ``diseases``), then mark the executor ready
+
+        Thread and inline modes share this process's registry. Process mode
+        warms the workers in their initializer and waits for each to start.
+        With a reachable sidecar the models live there, so its report is
+        used and nothing is loaded here. Models not warmed up load on first
+        use.
+        """
+        diseases = warm_up_diseases() if diseases is None else diseases
+        sidecar = sidecar_client()
+        health = sidecar.health() if sidecar is not None and diseases else None
+        if not diseases:
+            self.warm_up_report = {}
+        elif health is not None and health['up']:
+            self.warm_up_report = health['models']
+        elif self.mode == 'process':
+            pool = self._get_pool()
+            futures = [pool.submit(_warm_up_worker, diseases) for _ in range(self.max_workers)]
+            self.warm_up_report = [future.result() for future in futures][-1]
+        else:
+            self.warm_up_report = DISEASE_PREDICTORS.warm_up(diseases)
+        self.ready.set()
+        failed = [d for d, r in self.warm_up_report.items() if r['status'] == 'failed']
+        warmed = [d for d, r in self.warm_up_report.items() if r['status'] == 'ready']
+        logger.info(f"Inference ready ({len(warmed)} models warmed"
+                    f"{', failed: ' + ', '.join(failed) if failed else ''})")
+        return self.warm_up_report
+
+    def predict(self, disease: str, data: Dict[str, Any], timeout: Optional[float] = None) -> Tuple[Any, float, str]:
+        """Off-loop equivalent of ``get_predictor(disease).predict(data)``
+
+        Returns ``(label, confidence, model_version)``. Results are served
+        from the prediction cache when the same features were already
+        scored by the current version of the model, and go through the
+        micro-batcher when one is configured. With a reachable sidecar
+        they are sent to it one by one instead, so its own batcher can
+        combine requests from every web worker.
+        """
+        features, key, cached = self._cached(disease, data)
+        if cached is not None:
+            return cached
+        if self.batcher is not None and features is not None and disease in DISEASE_PREDICTORS \
+                and not self._sidecar_available():
+            result = self.batcher.submit(disease, features, timeout)
+        else:
+            (label, confidence), version = self.run(disease, 'predict', data, timeout)
+            result = (to_python(label), to_python(confidence), version)
+        if key is not None:
+            self.cache.set(key, result)
+        return result
+
+    def _cached(self, disease: str, data: Dict[str, Any]) -> Tuple[Optional[List[float]], Optional[str], Any]:
+        """Features, prediction cache key and cached result (each None when unavailable)"""
+        try:
+            features = prepare_features(disease, data)
+        except (TypeError, ValueError):
+            features = None
+        if self.cache is None or features is None or disease not in DISEASE_PREDICTORS:
+            return features, None, None
+        key = self.cache.key(disease, features, DISEASE_PREDICTORS.version(disease))
+        return features, key, self.cache.get(key)
+
+    def predict_many(self, requests: Dict[str, Dict[str, Any]],
+                     timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Predict several diseases for one patient concurrently
+
+        Each value is ``(label, confidence, model_version)`` or the
+        exception raised for that disease. Every disease is submitted to
+        the inference pool before any is waited on, and thread mode sizes
+        the pool for one task per disease, so the whole call takes about as
+        long as the slowest model.
+        """
+        if self.mode == 'inline':
+            return {disease: self._outcome(self.predict, disease, data, timeout) for disease, data in requests.items()}
+        results, pending = {}, {}
+        for disease, data in requests.items():
+            _, key, cached = self._cached(disease, data)
+            if cached is not None:
+                results[disease] = cached
+                continue
+            try:
+                pending[disease] = key, self._submit(disease, 'predict', data)
+            except Exception as e:
+                results[disease] = e
+        for disease, (key, (future, submitted)) in pending.items():
+            try:
+                (label, confidence), version = self._collect(disease, future, submitted, timeout)
+            except Exception as e:
+                results[disease] = e
+                continue
+            results[disease] = (to_python(label), to_python(confidence), version)
+            if key is not None:
+                self.cache.set(key, results[disease])
+        return results
+
+    @staticmethod
+    def _outcome(fn, *args) -> Any:
+        try:
+            return fn(*args)
+        except Exception as e:
+            return e
+
+    def predict_batch(self, disease: str, rows: Any,
+                      timeout: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, str]:
+        """Off-loop equivalent of ``get_predictor(disease).predict_batch(rows)``, plus the model version"""
+        (labels, confidences), version = self.run(disease, 'predict_batch', rows, timeout)
+        return labels, confidences, version
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'ready': self.ready.is_set(),
+            'workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'queue_wait_ms': self.queue_wait.snapshot(),
+            'compute_ms': self.compute.snapshot(),
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'micro_batching': self.batcher.metrics() if self.batcher is not None else None,
+            'models': {
+                'versions': DISEASE_PREDICTORS.versions(),
+                'swaps': DISEASE_PREDICTORS.swaps,
+                'reload_failures': DISEASE_PREDICTORS.reload_failures,
+            },
+            'sidecar': self.sidecar_status(),
+        }
+
+    @staticmethod
+    def _sidecar_available() -> bool:
+        sidecar = sidecar_client()
+        return sidecar is not None and sidecar.available()
+
+    def sidecar_status(self) -> Optional[Dict[str, Any]]:
+        """Health of the inference sidecar, or None when predicting in-process"""
+        sidecar = sidecar_client()
+        if sidecar is None:
+            return None
+        return dict(sidecar.health(), connection_failures=sidecar.failures)
+
+    def shutdown(self, wait: bool = True):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
+
+
+class SpeculativeScorer:
+    """Scores a prediction in the background as soon as its parameters are complete
+
+    Each scheduled result is remembered with a digest of the parameters and
+    model version it was computed from. ``take`` only hands it out while
+    both still match, so a parameter edited in the meantime (or a model
+    swapped in) makes it stale and it is thrown away. Results also land in
+    the executor's prediction cache, which other workers may share.
+    """
+
+    def __init__(self, executor: InferenceExecutor, max_size: int = 1024, ttl: float = 600.0,
+                 max_workers: int = 2):
+        self.executor = executor
+        self.max_workers = max_workers
+        self._entries = TTLCache(max_size, ttl)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.scheduled = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.discarded = 0
+
+    @classmethod
+    def from_config(cls, executor: InferenceExecutor) -> Optional['SpeculativeScorer']:
+        if not Config.SPECULATIVE_SCORING:
+            return None
+        return cls(executor, ttl=Config.SPECULATIVE_TTL)
+
+    @staticmethod
+    def digest(disease: str, parameters: Dict[str, Any]) -> str:
+        payload = json.dumps(parameters, sort_keys=True, default=str)
+        version = DISEASE_PREDICTORS.version(disease)
+        return hashlib.sha1(f"{disease}:{version}:{payload}".encode()).hexdigest()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = waiting_thread_pool(self.max_workers, 'speculative')
+            return self._pool
+
+    def schedule(self, prediction_id: str, disease: str, parameters: Dict[str, Any]):
+        """Start scoring ``parameters`` for a prediction unless the same inputs already are
+
+        A result computed from different inputs is replaced and cancelled.
+        """
+        digest = self.digest(disease, parameters)
+        entry = self._entries.get(prediction_id)
+        if entry is not None:
+            if entry[0] == digest:
+                return
+            entry[1].cancel()
+            self.discarded += 1
+        future = self._get_pool().submit(self.executor.predict, disease, dict(parameters))
+        self._entries.set(prediction_id, (digest, future))
+        self.scheduled += 1
+
+    def invalidate(self, prediction_id: str):
+        """Forget any speculative result for a prediction whose inputs changed"""
+        entry = self._entries.get(prediction_id)
+        if entry is None:
+            return
+        self._entries.delete(prediction_id)
+        entry[1].cancel()
+        self.discarded += 1
+
+    def take(self, prediction_id: str, disease: str, parameters: Dict[str, Any],
+             timeout: Optional[float] = None) -> Optional[Tuple[Any, float, str]]:
+        """Speculative result for exactly these inputs, or None
+
+        Waits for a result that is still being computed; it was started
+        earlier, so it finishes sooner than a fresh prediction would.
+        """
+        entry = self._entries.get(prediction_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.delete(prediction_id)
+        digest, future = entry
+        if digest != self.digest(disease, parameters):
+            future.cancel()
+            self.stale += 1
+            return None
+        try:
+            result = future.result(timeout=timeout or self.executor.timeout)
+        except Exception as e:
+            logger.warning(f"Speculative prediction {prediction_id} failed: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'scheduled': self.scheduled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'discarded': self.discarded,
+            'stored': len(self._entries),
+        }
+
+    def shutdown(self, wait: bool = True):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
+
+
+# Shared executor for socket handlers and HTTP routes
+inference_executor = InferenceExecutor.from_config()
+speculative_scorer = SpeculativeScorer.from_config(inference_executor)
@@ -0,0 +1,303 @@
+"""Inference sidecar shared by all web workers over a Unix domain socket.
+
+Usage:
+    python inference_server.py [--socket /tmp/medipredict-inference.sock]
+
+The sidecar owns DISEASE_PREDICTORS, so models are loaded (and warmed up,
+and hot-reloaded) once per host instead of once per gunicorn worker.
+Requests go through its own InferenceExecutor, so concurrent single
+predictions from different workers are micro-batched together.
+
+Web workers opt in with INFERENCE_SIDECAR=<socket path>. ``get_predictor``
+then returns a SidecarPredictor, which has the DiseasePredictor surface
+but forwards calls to the sidecar. If the sidecar cannot be reached, the
+call runs in-process instead and the sidecar is retried after
+INFERENCE_SIDECAR_RETRY seconds.
+
+Wire format: an 8-byte prefix with the lengths of a JSON header and a
+binary body. The body carries float64 matrices as raw bytes; nothing is
+unpickled.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from models import DISEASE_PREDICTORS, PredictionError
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = struct.Struct('>II')
+
+
+class SidecarUnavailable(Exception):
+    """Raised when the sidecar cannot be reached"""
+    pass
+
+
+def send_message(stream: Any, header: Dict[str, Any], body: bytes = b''):
+    raw = json.dumps(header).encode()
+    stream.write(_PREFIX.pack(len(raw), len(body)) + raw + body)
+    stream.flush()
+
+
+def _read_exactly(stream: Any, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError('Connection closed')
+    return data
+
+
+def recv_message(stream: Any) -> Tuple[Dict[str, Any], bytes]:
+    header_size, body_size = _PREFIX.unpack(_read_exactly(stream, _PREFIX.size))
+    header = json.loads(_read_exactly(stream, header_size))
+    body = _read_exactly(stream, body_size) if body_size else b''
+    return header, body
+
+
+def _encode_rows(rows: Any) -> Tuple[Dict[str, Any], bytes]:
+    """Numeric matrices travel as raw bytes, parameter dicts as JSON"""
+    if isinstance(rows, np.ndarray):
+        matrix = np.ascontiguousarray(rows, dtype=np.float64)
+        return {'shape': list(matrix.shape)}, matrix.tobytes()
+    return {'rows': list(rows)}, b''
+
+
+def _decode_rows(header: Dict[str, Any], body: bytes) -> Any:
+    if 'shape' in header:
+        return np.frombuffer(body, dtype=np.float64).reshape(header['shape'])
+    return header['rows']
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serves requests on one persistent connection until the client closes it"""
+
+    def handle(self):
+        while True:
+            try:
+                header, body = recv_message(self.rfile)
+            except (EOFError, ConnectionError):
+                return
+            try:
+                response, response_body = self.server.dispatch(header, body)
+            except Exception as e:
+                response, response_body = {'ok': False, 'error': str(e), 'type': type(e).__name__}, b''
+            try:
+                send_message(self.wfile, response, response_body)
+            except (BrokenPipeError, ConnectionError):
+                return
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answers predict calls from web workers with a shared executor"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, executor: Any):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+        self.socket_path = socket_path
+        self.executor = executor
+        self.started = time.monotonic()
+
+    def dispatch(self, header: Dict[str, Any], body: bytes) -> Tuple[Dict[str, Any], bytes]:
+        op = header.get('op')
+        if op == 'health':
+            return {
+                'ok': True,
+                'pid': os.getpid(),
+                'uptime': time.monotonic() - self.started,
+                'ready': self.executor.ready.is_set(),
+                'models': self.executor.warm_up_report,
+                'versions': DISEASE_PREDICTORS.versions(),
+                'micro_batching': self.executor.batcher.metrics() if self.executor.batcher is not None else None,
+            }, b''
+        disease = header.get('disease')
+        if op == 'predict':
+            label, confidence, version = self.executor.predict(disease, header['data'])
+            return {'ok': True, 'label': label, 'confidence': confidence, 'version': version}, b''
+        if op in ('predict_batch', 'predict_risk_batch'):
+            (labels, values), version = self.executor.run(disease, op, _decode_rows(header, body))
+            return {'ok': True, 'labels': np.asarray(labels).tolist(), 'version': version}, \
+                np.ascontiguousarray(values, dtype=np.float64).tobytes()
+        raise ValueError(f'Unknown operation: {op}')
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class SidecarClient:
+    """Thread-safe client with one persistent connection per thread
+
+    After a connection failure the sidecar is considered down for
+    ``retry_interval`` seconds, so callers fall back without waiting on it.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 10.0, retry_interval: float = 5.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._local = threading.local()
+        self._down_until = 0.0
+        self.failures = 0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _stream(self) -> Any:
+        stream = getattr(self._local, 'stream', None)
+        if stream is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            stream = self._local.stream = sock.makefile('rwb')
+            self._local.sock = sock
+        return stream
+
+    def _close(self):
+        for name in ('stream', 'sock'):
+            handle = getattr(self._local, name, None)
+            if handle is not None:
+                try:
+                    handle.close()
+                except OSError:
+                    pass
+                setattr(self._local, name, None)
+
+    def call(self, header: Dict[str, Any], body: bytes = b'') -> Tuple[Dict[str, Any], bytes]:
+        try:
+            stream = self._stream()
+            send_message(stream, header, body)
+            response, response_body = recv_message(stream)
+        except (OSError, EOFError, ValueError) as e:
+            self._close()
+            self.failures += 1
+            self._down_until = time.monotonic() + self.retry_interval
+            raise SidecarUnavailable(f"Inference sidecar at {self.socket_path} unavailable: {e}")
+        if not response.get('ok'):
+            if response.get('type') == 'InferenceBusyError':
+                from inference import InferenceBusyError
+                raise InferenceBusyError(response['error'])
+            raise PredictionError(response.get('error', 'Sidecar prediction failed'))
+        return response, response_body
+
+    def health(self) -> Dict[str, Any]:
+        """Sidecar status, or ``{'up': False, ...}`` when it cannot be reached"""
+        try:
+            response, _ = self.call({'op': 'health'})
+        except SidecarUnavailable as e:
+            return {'up': False, 'socket': self.socket_path, 'error': str(e)}
+        response.pop('ok', None)
+        return dict(response, up=True, socket=self.socket_path)
+
+
+class SidecarPredictor:
+    """DiseasePredictor stand-in that runs predictions in the sidecar
+
+    Falls back to the in-process predictor for any call the sidecar cannot
+    take. ``version`` is the version that produced the last result.
+    """
+
+    def __init__(self, client: SidecarClient, disease: str):
+        self.client = client
+        self.disease = disease
+        self.version = DISEASE_PREDICTORS.version(disease)
+
+    def _fallback(self, method: str, payload: Any, error: Exception) -> Any:
+        logger.warning(f"{error}; running {self.disease} {method} in-process")
+        predictor = DISEASE_PREDICTORS[self.disease]
+        self.version = predictor.version
+        return getattr(predictor, method)(payload)
+
+    def predict(self, data: Dict[str, Any]) -> Tuple[Any, float]:
+        try:
+            response, _ = self.client.call({'op': 'predict', 'disease': self.disease, 'data': data})
+        except SidecarUnavailable as e:
+            return self._fallback('predict', data, e)
+        self.version = response['version']
+        return response['label'], response['confidence']
+
+    def _batch(self, method: str, rows: Any) -> Tuple[np.ndarray, np.ndarray]:
+        header, body = _encode_rows(rows)
+        try:
+            response, values = self.client.call(dict(header, op=method, disease=self.disease), body)
+        except SidecarUnavailable as e:
+            return self._fallback(method, rows, e)
+        self.version = response['version']
+        return np.array(response['labels']), np.frombuffer(values, dtype=np.float64).copy()
+
+    def predict_batch(self, rows: Any) -> Tuple[np.ndarray, np.ndarray]:
+        return self._batch('predict_batch', rows)
+
+    def predict_risk_batch(self, rows: Any) -> Tuple[np.ndarray, np.ndarray]:
+        return self._batch('predict_risk_batch', rows)
+
+
+_client: Optional[SidecarClient] = None
+_client_lock = threading.Lock()
+
+
+def sidecar_client() -> Optional[SidecarClient]:
+    """Shared client for INFERENCE_SIDECAR, or None when the sidecar is not configured"""
+    global _client
+    if not Config.INFERENCE_SIDECAR:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = SidecarClient(Config.INFERENCE_SIDECAR, timeout=Config.INFERENCE_TIMEOUT,
+                                    retry_interval=Config.INFERENCE_SIDECAR_RETRY)
+        return _client
+
+
+def sidecar_predictor(disease: str) -> Optional[SidecarPredictor]:
+    """Predictor served by the sidecar, or None if it is not configured or down"""
+    client = sidecar_client()
+    if client is None or not client.available() or disease not in DISEASE_PREDICTORS:
+        return None
+    return SidecarPredictor(client, disease)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', default=Config.INFERENCE_SIDECAR or '/tmp/medipredict-inference.sock')
+    args = parser.parse_args()
+
+    # The sidecar itself always predicts in-process
+    Config.INFERENCE_SIDECAR = ''
+    from inference import InferenceExecutor
+    executor = InferenceExecutor.from_config()
+    executor.warm_up()
+    if Config.MODEL_HOT_RELOAD:
+        DISEASE_PREDICTORS.start_watcher()
+
+    server = InferenceServer(args.socket, executor)
+    # Remove the socket file on SIGTERM as well as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Inference sidecar listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
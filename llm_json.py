@@ -0,0 +1,259 @@
+"""Incremental parsing of the structured JSON reply the system prompt asks for.
+
+The model is told to answer with ``{"intent", "entities", "confidence",
+"response"}``. ``StructuredReplyParser`` follows the JSON structure as
+tokens arrive, so the top-level ``response`` string can be shown while the
+rest is still being generated, and ``finish`` recovers the fields from
+output that is truncated or slightly malformed instead of failing the
+whole call:
+
+- ``clean``: the reply parsed as is
+- ``repaired``: parsed after trimming surrounding text and code fences,
+  dropping trailing commas and closing an unterminated string or object
+- ``salvaged``: fields picked out one by one from what was generated
+- ``plain_text``: no JSON at all; the text itself becomes the response
+"""
+
+import json
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OUTCOMES = ('clean', 'repaired', 'salvaged', 'plain_text', 'failed')
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_CODE_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+
+
+class ReplyParseError(Exception):
+    """Raised when nothing usable can be recovered from a reply"""
+    pass
+
+
+class StructuredReplyParser:
+    """Tracks the JSON structure of a streamed reply one character at a time"""
+
+    def __init__(self, stream_field: str = 'response'):
+        self.stream_field = stream_field
+        self.raw = ''
+        self.streamed = ''
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = ''
+        self._high_surrogate = ''
+        self._expect_key = False
+        self._string_is_key = False
+        self._key = ''
+        self._last_key: Optional[str] = None
+        self._streaming = False
+
+    @property
+    def complete(self) -> bool:
+        """Whether the top-level object has been closed"""
+        return self.end is not None
+
+    def feed(self, token: str) -> str:
+        """Consume raw model output and return newly completed response text"""
+        offset = len(self.raw)
+        self.raw += token
+        if self.complete:
+            return ''
+        out = []
+        for i, char in enumerate(token, offset):
+            if self._in_string:
+                self._string_char(char, out)
+            elif self.start is None:
+                if char == '{':
+                    self.start = i
+                    self._open('{')
+            else:
+                self._structure_char(char, i)
+                if self.complete:
+                    break
+        delta = ''.join(out)
+        self.streamed += delta
+        return delta
+
+    def _open(self, bracket: str):
+        self._stack.append(bracket)
+        self._expect_key = bracket == '{'
+
+    def _structure_char(self, char: str, i: int):
+        if char == '"':
+            self._in_string = True
+            self._string_is_key = self._expect_key and self._stack[-1] == '{'
+            self._key = ''
+            self._streaming = (not self._string_is_key and len(self._stack) == 1
+                               and self._last_key == self.stream_field)
+        elif char in '{[':
+            self._open(char)
+        elif char in '}]':
+            if self._stack:
+                self._stack.pop()
+            if not self._stack:
+                self.end = i + 1
+            self._expect_key = False
+        elif char == ',':
+            self._expect_key = bool(self._stack) and self._stack[-1] == '{'
+        elif char == ':':
+            self._expect_key = False
+
+    def _string_char(self, char: str, out: List[str]):
+        if self._escape:
+            self._escape += char
+            if self._escape[1] == 'u' and len(self._escape) < 6:
+                return
+            decoded = self._decode_escape(self._escape)
+            self._escape = ''
+            self._append(decoded, out)
+        elif char == '\\':
+            self._escape = char
+        elif char == '"':
+            self._in_string = False
+            if self._string_is_key:
+                if len(self._stack) == 1:
+                    self._last_key = self._key
+                self._expect_key = False
+            self._streaming = False
+        else:
+            self._append(char, out)
+
+    def _decode_escape(self, escape: str) -> str:
+        if escape[1] != 'u':
+            return _ESCAPES.get(escape[1], escape[1])
+        try:
+            code = int(escape[2:], 16)
+        except ValueError:
+            return escape
+        if 0xD800 <= code < 0xDC00:
+            self._high_surrogate = escape
+            return ''
+        if 0xDC00 <= code < 0xE000 and self._high_surrogate:
+            pair, self._high_surrogate = self._high_surrogate + escape, ''
+            return json.loads(f'"{pair}"')
+        return chr(code)
+
+    def _append(self, text: str, out: List[str]):
+        if self._string_is_key:
+            self._key += text
+        elif self._streaming:
+            out.append(text)
+
+    def finish(self) -> Dict[str, Any]:
+        """Best-effort parse of everything fed so far
+
+        Returns the normalized reply with an ``outcome`` (one of OUTCOMES
+        except ``failed``); raises ReplyParseError if nothing is usable.
+        """
+        if self.start is None:
+            text = _CODE_FENCE.sub('', self.raw).strip()
+            if not text:
+                raise ReplyParseError('Empty reply')
+            return _normalize({'response': text}, 'plain_text')
+
+        candidate = self.raw[self.start:self.end]
+        try:
+            return _normalize(json.loads(candidate), 'clean' if self.raw.strip() == candidate else 'repaired')
+        except ValueError:
+            pass
+        try:
+            repaired = _normalize(json.loads(self._repair(candidate), strict=False), 'repaired')
+            if repaired['response']:
+                return repaired
+        except ValueError:
+            pass
+        salvaged = self._salvage(candidate)
+        if salvaged.get('response'):
+            return _normalize(salvaged, 'salvaged')
+        raise ReplyParseError(f'No response could be recovered from: {self.raw[:200]!r}')
+
+    def _repair(self, candidate: str) -> str:
+        """Close whatever is still open at the point generation stopped"""
+        repaired = candidate
+        if self._in_string:
+            repaired = repaired[:len(repaired) - len(self._escape)] + '"'
+        repaired = repaired.rstrip()
+        if repaired.endswith(':'):
+            repaired += ' null'
+        repaired = repaired.rstrip(',')
+        repaired += ''.join('}' if bracket == '{' else ']' for bracket in reversed(self._stack))
+        return _TRAILING_COMMA.sub(r'\1', repaired)
+
+    def _salvage(self, candidate: str) -> Dict[str, Any]:
+        fields: Dict[str, Any] = {}
+        intent = re.search(r'"intent"\s*:\s*"([^"\\]*)"', candidate)
+        if intent:
+            fields['intent'] = intent.group(1)
+        confidence = re.search(r'"confidence"\s*:\s*(-?\d+(?:\.\d+)?)', candidate)
+        if confidence:
+            fields['confidence'] = float(confidence.group(1))
+        entities = re.search(r'"entities"\s*:\s*(\[.*?\])\s*[,}]', candidate, re.DOTALL)
+        if entities:
+            try:
+                fields['entities'] = json.loads(entities.group(1), strict=False)
+            except ValueError:
+                pass
+        if self.streamed:
+            fields['response'] = self.streamed
+        return fields
+
+
+def _normalize(reply: Any, outcome: str) -> Dict[str, Any]:
+    """The four reply fields with the expected types, plus the parse outcome"""
+    if not isinstance(reply, dict):
+        reply = {'response': reply if isinstance(reply, str) else json.dumps(reply)}
+    entities = reply.get('entities')
+    try:
+        confidence = float(reply.get('confidence') or 0.0)
+    except (TypeError, ValueError):
+        confidence = 0.0
+    if 1.0 < confidence <= 100.0:
+        # Some replies give a percentage
+        confidence /= 100.0
+    confidence = min(max(confidence, 0.0), 1.0)
+    response = reply.get('response')
+    return dict(
+        reply,
+        intent=reply.get('intent') if isinstance(reply.get('intent'), str) else None,
+        entities=entities if isinstance(entities, list) else [],
+        confidence=confidence,
+        response=response if isinstance(response, str) else ('' if response is None else str(response)),
+        outcome=outcome,
+    )
+
+
+def parse_reply(text: str) -> Dict[str, Any]:
+    """Parse a complete reply the same way a streamed one is"""
+    parser = StructuredReplyParser()
+    parser.feed(text)
+    return parser.finish()
+
+
+class ParseStats:
+    """How often replies needed recovery, by outcome"""
+
+    def __init__(self):
+        self.counts = dict.fromkeys(OUTCOMES, 0)
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        recovered = counts['repaired'] + counts['salvaged'] + counts['plain_text']
+        return dict(
+            counts,
+            total=total,
+            recovery_rate=recovered / total if total else 0.0,
+            failure_rate=counts['failed'] / total if total else 0.0,
+        )
@@ -0,0 +1,40 @@
+"""Rolling latency and size statistics reported by the metrics endpoints."""
+
+import threading
+from collections import deque
+from typing import Dict
+
+import numpy as np
+
+
+class RollingStats:
+    """Count, mean and percentiles over the most recent samples"""
+
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, value: float):
+        with self._lock:
+            self.samples.append(value)
+            self.count += 1
+            self.total += value
+
+    def snapshot(self, scale: float = 1000.0) -> Dict[str, float]:
+        """Summary in milliseconds by default"""
+        with self._lock:
+            recent = np.array(self.samples)
+            count, total = self.count, self.total
+        if not count:
+            return {'count': 0}
+        p50, p95, p99 = np.percentile(recent, [50, 95, 99]) * scale
+        return {
+            'count': count,
+            'mean': total / count * scale,
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'max': float(recent.max() * scale),
+        }
@@ -0,0 +1,171 @@
+"""Memory-mapped model artifacts shared between worker processes.
+
+An artifact is a directory holding ``model.pkl``, the estimator pickled with
+its large NumPy arrays replaced by references, and ``arrays.bin``, those
+arrays laid out back to back. Loading maps ``arrays.bin`` copy-on-write, so
+every gunicorn worker on a host reads the same page-cache pages and only
+pays for a private copy if it ever writes to an array (inference doesn't).
+
+sklearn's ``Tree`` copies its node table into a private buffer when it is
+unpickled, so for tree ensembles the saving applies to the arrays estimators
+keep by reference (classes, coefficients, support vectors). Converting with
+``--compiled`` stores the NumPy kernels from compiled_models instead, which
+evaluate straight from the mapped arrays, so forests are shared as well.
+
+Convert the shipped pickles with:
+    python model_store.py convert [--src models] [--dest models/shared] [--compiled]
+"""
+
+import argparse
+import glob
+import logging
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Any
+
+import numpy as np
+
+from compiled_models import compile_model
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = 'model.pkl'
+ARRAYS_FILE = 'arrays.bin'
+
+# Arrays smaller than this stay inline in the pickle
+MIN_SHARED_BYTES = 1024
+ALIGNMENT = 64
+
+
+class _ArtifactPickler(pickle.Pickler):
+    """Pickler that moves large numeric arrays into a flat side file"""
+
+    def __init__(self, file, arrays_file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays_file = arrays_file
+        self.offset = 0
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray) or obj.dtype.hasobject or obj.nbytes < MIN_SHARED_BYTES:
+            return None
+        padding = -self.offset % ALIGNMENT
+        self.arrays_file.write(b'\0' * padding)
+        self.offset += padding
+        order = 'F' if obj.flags.f_contiguous and not obj.flags.c_contiguous else 'C'
+        self.arrays_file.write(obj.tobytes(order=order))
+        pid = ('ndarray', self.offset, obj.dtype, obj.shape, order)
+        self.offset += obj.nbytes
+        return pid
+
+
+class _ArtifactUnpickler(pickle.Unpickler):
+    """Unpickler that resolves array references to views of the mapped file"""
+
+    def __init__(self, file, buffer):
+        super().__init__(file)
+        self.buffer = buffer
+
+    def persistent_load(self, pid):
+        kind, offset, dtype, shape, order = pid
+        if kind != 'ndarray':
+            raise pickle.UnpicklingError(f"Unknown artifact reference: {kind}")
+        return np.ndarray(shape, dtype=dtype, buffer=self.buffer, offset=offset, order=order)
+
+
+def save_artifact(model: Any, path: str) -> str:
+    """Write ``model`` as an artifact directory, replacing ``path`` atomically"""
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.artifact-', dir=parent)
+    try:
+        os.chmod(staging, 0o755)
+        with open(os.path.join(staging, MODEL_FILE), 'wb') as model_file, \
+                open(os.path.join(staging, ARRAYS_FILE), 'wb') as arrays_file:
+            _ArtifactPickler(model_file, arrays_file).dump(model)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(staging, path)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return path
+
+
+def load_artifact(path: str) -> Any:
+    """Load an artifact directory with its arrays memory-mapped"""
+    arrays_path = os.path.join(path, ARRAYS_FILE)
+    buffer = None
+    if os.path.getsize(arrays_path) > 0:
+        buffer = np.memmap(arrays_path, dtype=np.uint8, mode='c')
+    with open(os.path.join(path, MODEL_FILE), 'rb') as f:
+        return _ArtifactUnpickler(f, buffer).load()
+
+
+def is_artifact(path: str) -> bool:
+    """Whether ``path`` is an artifact directory"""
+    return os.path.isfile(os.path.join(path, MODEL_FILE))
+
+
+def is_memory_mapped(array: np.ndarray) -> bool:
+    """Whether an array's memory comes from a mapped file"""
+    base = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, 'base', None)
+    return False
+
+
+def artifact_name(model_path: str) -> str:
+    """Artifact directory name for a pickle path (``models/heart.pkl`` -> ``heart``)"""
+    return os.path.splitext(os.path.basename(model_path))[0]
+
+
+def convert(src: str, dest: str, verify: bool = True, compiled: bool = False) -> None:
+    """Convert every pickle in ``src`` into an artifact under ``dest``
+
+    With ``compiled`` the artifact holds the NumPy kernel from
+    compiled_models, whose arrays are read straight from the mapping.
+    """
+    for model_path in sorted(glob.glob(os.path.join(src, '*.pkl'))):
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+        stored = compile_model(model) if compiled else model
+        target = save_artifact(stored, os.path.join(dest, artifact_name(model_path)))
+        shared = os.path.getsize(os.path.join(target, ARRAYS_FILE))
+        print(f"{model_path} -> {target} ({shared / 1024:.0f} KiB mapped)")
+        if verify:
+            _verify(model, load_artifact(target), model_path)
+
+
+def _verify(original: Any, loaded: Any, name: str) -> None:
+    """Check a loaded artifact predicts exactly like the original model"""
+    n_features = getattr(original, 'n_features_in_', None)
+    if n_features is None:
+        return
+    rows = np.random.default_rng(0).random((64, n_features))
+    method = 'predict_proba' if hasattr(original, 'predict_proba') else 'predict'
+    if not np.allclose(getattr(original, method)(rows), getattr(loaded, method)(rows)):
+        raise RuntimeError(f"Artifact for {name} does not reproduce the original {method}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage memory-mapped model artifacts')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help='convert pickled models to artifacts')
+    convert_parser.add_argument('--src', default='models')
+    convert_parser.add_argument('--dest', default=os.path.join('models', 'shared'))
+    convert_parser.add_argument('--no-verify', action='store_true')
+    convert_parser.add_argument('--compiled', action='store_true',
+                                help='store NumPy kernels so tree node tables are shared too')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        convert(args.src, args.dest, verify=not args.no_verify, compiled=args.compiled)
+
+
+if __name__ == '__main__':
+    main()
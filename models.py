@@ -1,9 +1,18 @@
 # models.py
 import os
+import hashlib
+import json
 import pickle
 import numpy as np
 import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
 from typing import Any, Dict, List, Tuple, Optional
+from config import Config
+from compiled_models import compare_models, compile_model
+from model_store import artifact_name, is_artifact, is_memory_mapped, load_artifact
 
 # Configure logging
 logging.basicConfig(
@@ -17,22 +26,67 @@ class PredictionError(Exception):
     pass
 
 class DiseasePredictor:
-    def __init__(self, model_path: str):
-        """Initialize disease predictor with model path"""
+    def __init__(self, model_path: str, compiled: bool = False, schema: Optional['ParameterSchema'] = None,
+                 version: Optional[str] = None, precision: str = 'float64'):
+        """Initialize disease predictor with model path
+
+        With ``compiled`` the estimator is replaced by a NumPy kernel from
+        compiled_models when its type is supported; batches larger than
+        the kernel's ``max_batch_rows`` still go to the estimator, which is
+        faster on them. With a ``schema``,
+        parameter dicts are converted in the schema's column order.
+        ``version`` defaults to the model file's fingerprint. With
+        ``precision='float32'`` a single-precision kernel is used if it
+        passes the accuracy check in ``_reduce_precision``; the estimator
+        is then dropped and inputs are built in float32 as well.
+        """
+        self.schema = schema
         self.model = self._load_model(model_path)
-        
+        self.fingerprint = model_fingerprint(model_path)
+        self.version = version or self.fingerprint
+        self.precision = 'float64'
+        self.input_dtype = np.float64
+        estimator = self.estimator = self.model
+        if compiled:
+            self.model = compile_model(estimator)
+        if precision == 'float32':
+            self._reduce_precision(estimator)
+
+    def _reduce_precision(self, estimator: Any, n_rows: int = 512):
+        """Switch to a float32 kernel if it agrees with the estimator
+
+        Labels must match on every row of a synthetic in-range validation
+        set and confidences may drift by at most PRECISION_TOLERANCE
+        percentage points; otherwise the model stays in float64.
+        """
+        candidate = compile_model(estimator, dtype=np.float32)
+        if candidate is estimator:
+            logger.info(f"No float32 kernel for {type(estimator).__name__}; keeping float64")
+            return
+        report = compare_models(estimator, candidate, self.synthetic_inputs(n_rows))
+        if report['label_mismatches'] or report['max_confidence_drift'] > Config.PRECISION_TOLERANCE:
+            logger.warning(f"float32 {type(estimator).__name__} outside tolerance ({report}); keeping float64")
+            return
+        # Large batches stay on the float32 kernel too, so the estimator is not kept
+        self.model = self.estimator = candidate
+        self.precision = 'float32'
+        self.input_dtype = np.float32
+
     def _load_model(self, model_path: str) -> Any:
         """Load and validate model"""
         try:
             if not os.path.exists(model_path):
                 raise FileNotFoundError(f"Model not found at {model_path}")
                 
-            with open(model_path, 'rb') as f:
-                model = pickle.load(f)
-                # Validate model type
-                if not hasattr(model, 'predict'):
-                    raise ValueError("Invalid model: missing predict method")
-                return model
+            if is_artifact(model_path):
+                model = load_artifact(model_path)
+            else:
+                with open(model_path, 'rb') as f:
+                    model = pickle.load(f)
+            # Validate model type
+            if not hasattr(model, 'predict'):
+                raise ValueError("Invalid model: missing predict method")
+            return model
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             raise PredictionError(f"Failed to load model: {str(e)}")
@@ -41,39 +95,537 @@ class DiseasePredictor:
         """Make prediction with confidence"""
         try:
             # Convert input data
-            input_array = np.array([self._prepare_input(data)])
-            
-            # Get probabilities if available
-            if hasattr(self.model, 'predict_proba'):
-                probabilities = self.model.predict_proba(input_array)[0]
-                prediction = self.model.predict(input_array)[0]
-                confidence = max(probabilities) * 100
-            else:
-                prediction = self.model.predict(input_array)[0]
-                confidence = 100.0
-                
-            return prediction, confidence
-            
+            input_array = self._prepare_batch([data])
+            predictions, confidences = self._predict_array(input_array)
+            return predictions[0], confidences[0]
+
         except Exception as e:
             logger.error(f"Prediction error: {e}")
             raise PredictionError(f"Failed to make prediction: {str(e)}")
-            
+
+    def predict_batch(self, rows: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Make predictions with confidence for many inputs in one model call
+
+        ``rows`` is a list of parameter dicts or a 2-D array with one row per
+        patient. Returns parallel arrays of labels and confidences.
+        """
+        try:
+            input_array = self._prepare_batch(rows)
+            if len(input_array) == 0:
+                return np.empty(0), np.empty(0)
+            return self._predict_array(input_array)
+
+        except Exception as e:
+            logger.error(f"Batch prediction error: {e}")
+            raise PredictionError(f"Failed to make batch prediction: {str(e)}")
+
+    def predict_risk_batch(self, rows: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Labels and probability (percent) of the last class, e.g. "has the disease"
+
+        Models without ``predict_proba`` report 100 or 0 from the label.
+        """
+        try:
+            input_array = self._prepare_batch(rows)
+            model = self._model_for(len(input_array))
+            if hasattr(model, 'predict_proba'):
+                probabilities = model.predict_proba(input_array)
+                labels = model.classes_.take(probabilities.argmax(axis=1))
+                return labels, probabilities[:, -1] * 100
+            labels = model.predict(input_array)
+            return labels, (labels == model.classes_[-1]) * 100.0
+        except Exception as e:
+            logger.error(f"Risk prediction error: {e}")
+            raise PredictionError(f"Failed to make risk prediction: {str(e)}")
+
+    def warm_up(self, batch_size: int = 8) -> float:
+        """Run synthetic in-range rows through the model, returning seconds taken
+
+        The first call into an estimator pays for lazy imports, allocator
+        growth and input checks; doing it here keeps that off the first
+        real request.
+        """
+        row = self.canary_input()
+        started = time.perf_counter()
+        self.predict_batch(row)
+        self.predict_batch(np.repeat(row, batch_size, axis=0))
+        return time.perf_counter() - started
+
+    def synthetic_inputs(self, n_rows: int, seed: int = 0) -> np.ndarray:
+        """Random rows of the model's input width, inside the schema ranges"""
+        row = self.canary_input()
+        low, high = np.zeros(row.shape[1]), np.ones(row.shape[1])
+        if self.schema is not None:
+            known = min(len(self.schema), row.shape[1])
+            low[:known], high[:known] = self.schema.low[:known], self.schema.high[:known]
+        return low + np.random.default_rng(seed).random((n_rows, row.shape[1])) * (high - low)
+
+    def canary_input(self) -> np.ndarray:
+        """One synthetic in-range row of the model's own input width
+
+        Columns described by the schema get their range midpoint, any
+        others 0.5.
+        """
+        width = int(getattr(self.model, 'n_features_in_', len(self.schema) if self.schema is not None else 0))
+        row = np.full((1, width), 0.5)
+        if self.schema is not None:
+            midpoints = self.schema.midpoints()[:width]
+            row[0, :len(midpoints)] = midpoints
+        return row
+
+    def _predict_array(self, input_array: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Labels and confidences from a single model evaluation
+
+        The label is read off the probability row through ``classes_`` rather
+        than calling ``predict`` again, which would re-run every estimator.
+        """
+        model = self._model_for(len(input_array))
+        if hasattr(model, 'predict_proba'):
+            probabilities = model.predict_proba(input_array)
+            best = probabilities.argmax(axis=1)
+            predictions = model.classes_.take(best)
+            confidences = probabilities[np.arange(len(best)), best] * 100
+        else:
+            predictions = model.predict(input_array)
+            confidences = np.full(len(predictions), 100.0)
+        return predictions, confidences
+
+    def _model_for(self, n_rows: int) -> Any:
+        """The compiled kernel, or the estimator (if kept) for batches the kernel is slower on"""
+        limit = getattr(self.model, 'max_batch_rows', None)
+        if limit is not None and n_rows > limit:
+            return self.estimator
+        return self.model
+
+    def _prepare_batch(self, rows: Any) -> np.ndarray:
+        """Convert a list of parameter dicts or a 2-D array to model format"""
+        if isinstance(rows, np.ndarray):
+            batch = rows.astype(self.input_dtype, copy=False)
+        elif self.schema is not None:
+            batch = self.schema.matrix(rows, self.input_dtype)
+        else:
+            batch = np.array([self._prepare_input(row) for row in rows], dtype=self.input_dtype)
+        if batch.size and batch.ndim != 2:
+            raise ValueError("Batch input must be two-dimensional")
+        return batch
+
     def _prepare_input(self, data: Dict[str, Any]) -> List[float]:
         """Convert input data to model format"""
+        if self.schema is not None:
+            return self.schema.vector(data).tolist()
         # Convert all values to float
         return [float(value) for value in data.values()]
 
-# Initialize disease predictors
-DISEASE_PREDICTORS = {
-    'diabetes': DiseasePredictor('models/diabetes.pkl'),
-    'heart': DiseasePredictor('models/heart.pkl'),
-    'liver': DiseasePredictor('models/liver.pkl'),
-    'breast_cancer': DiseasePredictor('models/breast_cancer.pkl'),
-    'parkinsons': DiseasePredictor('models/parkinsons_model.pkl'),
+def model_fingerprint(model_path: str) -> str:
+    """Short identifier that changes whenever a model file is replaced"""
+    if is_artifact(model_path):
+        paths = [os.path.join(model_path, name) for name in sorted(os.listdir(model_path))]
+    else:
+        paths = [model_path]
+    stats = [(os.path.basename(p), os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in paths]
+    return hashlib.sha1(repr(stats).encode()).hexdigest()[:12]
+
+
+def estimate_model_memory(obj: Any, _seen: Optional[Dict[int, Any]] = None) -> int:
+    """Approximate bytes held by a model's arrays
+
+    Walks attributes, containers and pickled state (sklearn ``Tree`` objects
+    keep their node tables there) and sums the size of every NumPy array.
+    """
+    # Keep visited objects alive so temporary state dicts can't reuse an id
+    seen = _seen if _seen is not None else {}
+    if id(obj) in seen:
+        return 0
+    seen[id(obj)] = obj
+
+    if isinstance(obj, np.ndarray):
+        # Mapped arrays live in the shared page cache, not in this worker
+        size = 0 if is_memory_mapped(obj) else obj.nbytes
+        if obj.dtype == object:
+            size += sum(estimate_model_memory(item, seen) for item in obj.flat)
+        return size
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return 0
+    if isinstance(obj, dict):
+        return sum(estimate_model_memory(value, seen) for value in obj.values())
+    if isinstance(obj, (list, tuple, set)):
+        return sum(estimate_model_memory(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        return estimate_model_memory(vars(obj), seen)
+    if hasattr(obj, '__getstate__'):
+        try:
+            return estimate_model_memory(obj.__getstate__(), seen)
+        except Exception:
+            return 0
+    return 0
+
+
+class ModelRegistry(Mapping):
+    """Versioned disease predictors, loaded on first use and hot-reloaded
+
+    Behaves like a read-only dict of disease name to ``DiseasePredictor``.
+    When ``max_memory_bytes`` is set, loading a model that pushes the total
+    estimated footprint over the cap unloads the least recently used ones.
+
+    Model files (and the optional JSON manifest mapping each disease to a
+    ``path`` and ``version``) are re-checked at most every
+    ``check_interval`` seconds. A changed model is loaded in the
+    background, validated on a canary input and then swapped in; callers
+    keep getting the previous version until the swap, and predictions
+    already running finish on the predictor they started with. A version
+    that fails validation is not retried until its file changes again.
+    """
+
+    def __init__(self, model_paths: Dict[str, str], max_memory_bytes: Optional[int] = None,
+                 artifact_dir: Optional[str] = None, compiled: bool = False,
+                 check_interval: float = 5.0, manifest_path: Optional[str] = None,
+                 precision: str = 'float64'):
+        self.model_paths = dict(model_paths)
+        self.max_memory_bytes = max_memory_bytes
+        self.artifact_dir = artifact_dir
+        self.compiled = compiled
+        self.precision = precision
+        self.check_interval = check_interval
+        self.manifest_path = manifest_path
+        self._manifest: Dict[str, Dict[str, str]] = {}
+        self._manifest_mtime: Optional[float] = None
+        self._predictors: 'OrderedDict[str, DiseasePredictor]' = OrderedDict()
+        self._memory: Dict[str, int] = {}
+        self._fingerprints: Dict[str, Tuple[float, str]] = {}
+        self._rejected: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._reloading = set()
+        self._loading: Dict[str, threading.Event] = {}
+        self._lock = threading.RLock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.swaps = 0
+        self.reload_failures = 0
+        self._read_manifest()
+
+    def __getitem__(self, disease: str) -> DiseasePredictor:
+        if disease not in self.model_paths:
+            raise KeyError(disease)
+        with self._lock:
+            predictor = self._predictors.get(disease)
+            if predictor is not None:
+                self._predictors.move_to_end(disease)
+        if predictor is None:
+            predictor = self._load_first(disease)
+        if self._changed(disease, predictor):
+            self.reload_async(disease)
+        return predictor
+
+    def _load_first(self, disease: str) -> DiseasePredictor:
+        """Load a disease that is not in memory, without holding the registry lock
+
+        Lookups of other diseases keep being served meanwhile; concurrent
+        callers for the same disease wait for the one load in progress.
+        """
+        while True:
+            with self._lock:
+                predictor = self._predictors.get(disease)
+                if predictor is not None:
+                    self._predictors.move_to_end(disease)
+                    return predictor
+                loading = self._loading.get(disease)
+                if loading is None:
+                    loading = self._loading[disease] = threading.Event()
+                    break
+            loading.wait()
+        try:
+            predictor = self._load(disease)
+            with self._lock:
+                self._install(disease, predictor)
+            return predictor
+        finally:
+            with self._lock:
+                self._loading.pop(disease, None)
+            loading.set()
+
+    def __iter__(self):
+        return iter(self.model_paths)
+
+    def __len__(self) -> int:
+        return len(self.model_paths)
+
+    def __contains__(self, disease: object) -> bool:
+        return disease in self.model_paths
+
+    def resolve_path(self, disease: str) -> str:
+        """Manifest path for a disease, else its memory-mapped artifact or pickle"""
+        model_path = self._manifest.get(disease, {}).get('path') or self.model_paths[disease]
+        if self.artifact_dir:
+            artifact_path = os.path.join(self.artifact_dir, artifact_name(model_path))
+            if is_artifact(artifact_path):
+                return artifact_path
+        return model_path
+
+    def fingerprint(self, disease: str, refresh: bool = False) -> str:
+        """Fingerprint of a disease's model file on disk, re-read at most every check_interval"""
+        now = time.monotonic()
+        checked = self._fingerprints.get(disease)
+        if refresh or checked is None or now - checked[0] >= self.check_interval:
+            checked = (now, model_fingerprint(self.resolve_path(disease)))
+            self._fingerprints[disease] = checked
+        return checked[1]
+
+    def version(self, disease: str) -> str:
+        """Version of the predictor serving a disease, or of its file if not loaded"""
+        predictor = self._predictors.get(disease)
+        if predictor is not None:
+            return predictor.version
+        return self._manifest.get(disease, {}).get('version') or self.fingerprint(disease)
+
+    def versions(self) -> Dict[str, Optional[str]]:
+        """Loaded version per disease, None for models not loaded yet"""
+        with self._lock:
+            return {disease: getattr(self._predictors.get(disease), 'version', None)
+                    for disease in self.model_paths}
+
+    def _load(self, disease: str) -> DiseasePredictor:
+        return DiseasePredictor(self.resolve_path(disease), compiled=self.compiled,
+                                schema=DISEASE_SCHEMAS.get(disease),
+                                version=self._manifest.get(disease, {}).get('version'),
+                                precision=self.precision)
+
+    def _install(self, disease: str, predictor: DiseasePredictor):
+        """Make ``predictor`` the one served for ``disease``; caller holds the lock"""
+        self._predictors[disease] = predictor
+        self._predictors.move_to_end(disease)
+        self._memory[disease] = estimate_model_memory((predictor.model, predictor.estimator))
+        logger.info(f"Loaded {disease} model {predictor.version} "
+                    f"({predictor.precision}, {self._memory[disease] / 1024:.0f} KiB)")
+        self._evict()
+
+    def _on_disk(self, disease: str, refresh: bool = False) -> Tuple[str, Optional[str]]:
+        """Fingerprint and manifest version of the model a disease should be serving"""
+        return self.fingerprint(disease, refresh), self._manifest.get(disease, {}).get('version')
+
+    def _changed(self, disease: str, predictor: DiseasePredictor) -> bool:
+        """Whether the model on disk differs from the loaded one and was not already rejected
+
+        A model file that is missing or unreadable, e.g. halfway through a
+        deploy that removes it before copying the new one in, counts as
+        unchanged so the loaded version keeps serving.
+        """
+        try:
+            fingerprint, version = on_disk = self._on_disk(disease)
+        except OSError as e:
+            logger.debug(f"Cannot check {disease} model on disk, keeping {predictor.version}: {e}")
+            return False
+        changed = fingerprint != predictor.fingerprint or (version is not None and version != predictor.version)
+        return changed and self._rejected.get(disease) != on_disk
+
+    def _read_manifest(self) -> bool:
+        """Reload the manifest if it changed; returns True when it did"""
+        if not self.manifest_path:
+            return False
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._manifest_mtime:
+            return False
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Invalid model manifest {self.manifest_path}: {e}")
+            return False
+        self._manifest = {disease: entry for disease, entry in manifest.items() if disease in self.model_paths}
+        self._manifest_mtime = mtime
+        self._fingerprints.clear()
+        return True
+
+    def validate_candidate(self, disease: str, candidate: DiseasePredictor):
+        """Canary check for a new version; raises PredictionError if it must not serve
+
+        The candidate has to score synthetic in-range rows with sane
+        confidences and keep the input width and labels of the version
+        it replaces.
+        """
+        candidate.warm_up()
+        row = candidate.canary_input()
+        width = row.shape[1]
+        labels, confidences = candidate.predict_batch(row)
+        if len(labels) != 1 or not np.all((confidences >= 0) & (confidences <= 100)):
+            raise PredictionError(f"Canary prediction returned invalid output: {labels}, {confidences}")
+        current = self._predictors.get(disease)
+        if current is not None:
+            if getattr(current.model, 'n_features_in_', width) != width:
+                raise PredictionError(f"Input width changed from {current.model.n_features_in_} to {width}")
+            old_classes = getattr(current.model, 'classes_', None)
+            new_classes = getattr(candidate.model, 'classes_', None)
+            if old_classes is not None and new_classes is not None and \
+                    not np.array_equal(old_classes, new_classes):
+                raise PredictionError(f"Labels changed from {list(old_classes)} to {list(new_classes)}")
+
+    def reload(self, disease: str) -> bool:
+        """Load, validate and swap in the version on disk; False if it was rejected
+
+        Loading and validation happen without the registry lock held, so
+        other diseases and the current version keep serving meanwhile.
+        """
+        on_disk = self._on_disk(disease, refresh=True)
+        try:
+            candidate = self._load(disease)
+            self.validate_candidate(disease, candidate)
+        except Exception as e:
+            self._rejected[disease] = on_disk
+            self.reload_failures += 1
+            logger.error(f"Rejected new {disease} model {on_disk[1] or on_disk[0]}, keeping current version: {e}")
+            return False
+        with self._lock:
+            previous = self._predictors.get(disease)
+            self._install(disease, candidate)
+            self._rejected.pop(disease, None)
+            self.swaps += 1
+        logger.info(f"Swapped {disease} model {getattr(previous, 'version', None)} -> {candidate.version}")
+        return True
+
+    def reload_async(self, disease: str):
+        """Start a background reload of a disease unless one is already running"""
+        with self._lock:
+            if disease in self._reloading:
+                return
+            self._reloading.add(disease)
+
+        def run():
+            try:
+                self.reload(disease)
+            finally:
+                with self._lock:
+                    self._reloading.discard(disease)
+
+        threading.Thread(target=run, name=f'reload-{disease}', daemon=True).start()
+
+    def check_for_updates(self) -> List[str]:
+        """Reload every loaded model whose file or manifest entry changed
+
+        Returns the diseases that were swapped.
+        """
+        if self._read_manifest():
+            logger.info(f"Model manifest {self.manifest_path} changed")
+        swapped = []
+        for disease in self.loaded():
+            predictor = self._predictors.get(disease)
+            if predictor is not None and self._changed(disease, predictor) and self.reload(disease):
+                swapped.append(disease)
+        return swapped
+
+    def start_watcher(self):
+        """Check for new model versions every ``check_interval`` seconds in the background"""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(max(self.check_interval, 1.0)):
+                try:
+                    self.check_for_updates()
+                except Exception as e:
+                    logger.error(f"Model watcher error: {e}")
+
+        self._stop.clear()
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _evict(self):
+        """Unload least-recently-used predictors until under the memory cap"""
+        if not self.max_memory_bytes:
+            return
+        while len(self._predictors) > 1 and self.memory_usage() > self.max_memory_bytes:
+            disease, _ = self._predictors.popitem(last=False)
+            freed = self._memory.pop(disease, 0)
+            logger.info(f"Evicted {disease} model ({freed / 1024:.0f} KiB)")
+
+    def unload(self, disease: str) -> bool:
+        """Drop a loaded predictor; it is reloaded on next use"""
+        with self._lock:
+            self._memory.pop(disease, None)
+            return self._predictors.pop(disease, None) is not None
+
+    def warm_up(self, diseases: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Load and warm up predictors, by default all of them
+
+        Failures are logged and reported per disease rather than raised, so
+        one broken model does not keep the others from serving. Warm-up
+        stops once the memory cap evicts a model it already warmed; that
+        model and the remaining ones are reported as ``deferred`` and load
+        on first use.
+        """
+        report = {}
+        full = False
+        for disease in diseases or list(self.model_paths):
+            if full:
+                report[disease] = {'status': 'deferred'}
+                continue
+            started = time.perf_counter()
+            try:
+                predictor = self[disease]
+                loaded = time.perf_counter()
+                warm_up_seconds = predictor.warm_up()
+                report[disease] = {
+                    'status': 'ready',
+                    'load_ms': (loaded - started) * 1000,
+                    'warm_up_ms': warm_up_seconds * 1000,
+                }
+            except Exception as e:
+                logger.warning(f"Warm-up failed for {disease} model: {e}")
+                report[disease] = {'status': 'failed', 'error': str(e)}
+            for warmed, entry in report.items():
+                if entry['status'] == 'ready' and warmed not in self._predictors:
+                    report[warmed] = {'status': 'deferred'}
+                    full = True
+        return report
+
+    def loaded(self) -> List[str]:
+        """Loaded diseases, least recently used first"""
+        with self._lock:
+            return list(self._predictors)
+
+    def memory_usage(self, disease: Optional[str] = None) -> int:
+        """Estimated bytes held by one loaded model, or by all of them"""
+        if disease is not None:
+            return self._memory.get(disease, 0)
+        return sum(self._memory.values())
+
+
+MODEL_PATHS = {
+    'diabetes': 'models/diabetes.pkl',
+    'heart': 'models/heart.pkl',
+    'liver': 'models/liver.pkl',
+    'breast_cancer': 'models/breast_cancer.pkl',
+    'parkinsons': 'models/parkinsons_model.pkl',
 }
 
+# Disease predictors, loaded lazily on first use
+DISEASE_PREDICTORS = ModelRegistry(
+    MODEL_PATHS,
+    max_memory_bytes=Config.MODEL_MEMORY_LIMIT_MB * 1024 * 1024 or None,
+    artifact_dir=Config.MODEL_ARTIFACT_DIR or None,
+    compiled=Config.MODEL_BACKEND == 'compiled',
+    check_interval=Config.MODEL_CHECK_INTERVAL,
+    manifest_path=Config.MODEL_MANIFEST or None,
+    precision=Config.MODEL_PRECISION
+)
+
 def get_predictor(disease: str) -> Optional[DiseasePredictor]:
-    """Get disease predictor for given disease type"""
+    """Get disease predictor for given disease type
+
+    With INFERENCE_SIDECAR set this is a client for the shared inference
+    sidecar while it is reachable, and the in-process predictor otherwise.
+    """
+    if Config.INFERENCE_SIDECAR:
+        # Imported here because the sidecar module builds on this one
+        from inference_server import sidecar_predictor
+        predictor = sidecar_predictor(disease)
+        if predictor is not None:
+            return predictor
     return DISEASE_PREDICTORS.get(disease)
 
 
@@ -82,21 +634,241 @@ def validate_all_parameters(disease_type: str, parameters: dict):
     Validates all parameters for a given disease type.
     Returns (is_valid, errors_dict)
     """
-    errors = {}
-    rules = DISEASE_PARAMETERS.get(disease_type.lower(), {})
-    for param, meta in rules.items():
-        value = parameters.get(param)
-        if value is None:
-            errors[param] = f"Missing parameter: {param}"
-            continue
-        rng = meta.get('range')
+    schema = DISEASE_SCHEMAS.get(disease_type.lower())
+    errors = schema.validate(parameters) if schema is not None else {}
+    return (len(errors) == 0), errors
+
+
+def map_profile(profile: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Split one patient profile into per-disease parameter sets
+
+    Keys are matched to parameter names case-insensitively. Returns, for
+    every disease with a schema, the parameters it takes from the profile,
+    the ones still missing and error messages for invalid values; a
+    disease is eligible when both of the latter are empty.
+    """
+    values = {str(name).lower(): value for name, value in profile.items() if value not in (None, '')}
+    mapped = {}
+    for disease, schema in DISEASE_SCHEMAS.items():
+        parameters = {name: values[name] for name in schema.names if name in values}
+        errors = schema.validate(parameters)
+        mapped[disease] = {
+            'parameters': parameters,
+            'missing': [name for name in schema.names if name not in parameters],
+            'errors': {name: message for name, message in errors.items() if name in parameters},
+        }
+    return mapped
+
+
+def prepare_features(disease: str, data: Dict[str, Any]) -> List[float]:
+    """Ordered float feature vector for a disease's parameter dict"""
+    schema = DISEASE_SCHEMAS.get(disease)
+    if schema is not None:
+        return schema.vector(data).tolist()
+    return [float(value) for value in data.values()]
+
+
+# Per-value validation codes used by ParameterSchema.validate_batch
+VALID, MISSING, INVALID, OUT_OF_RANGE = 0, 1, 2, 3
+
+
+def _coerce_column(column: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """Float values and validation codes for one column of a batch
+
+    Numeric arrays convert in one step, with NaN marking missing values.
+    Other columns treat None as missing and anything ``float`` rejects as
+    invalid, falling back to a per-value loop only when needed.
+    """
+    array = column if isinstance(column, np.ndarray) else None
+    if array is not None and array.dtype.kind in 'biuf':
+        values = array.astype(np.float64)
+        return values, np.where(np.isnan(values), MISSING, VALID).astype(np.int8)
+
+    objects = np.fromiter(column, dtype=object, count=len(column))
+    missing = np.fromiter((value is None for value in objects), dtype=bool, count=len(objects))
+    invalid = np.zeros(len(objects), dtype=bool)
+    try:
+        values = objects.astype(np.float64)
+    except (TypeError, ValueError):
+        values = np.full(len(objects), np.nan)
+        for i, value in enumerate(objects):
+            if missing[i]:
+                continue
+            try:
+                values[i] = float(value)
+            except Exception:
+                invalid[i] = True
+    codes = np.where(missing, MISSING, np.where(invalid, INVALID, VALID)).astype(np.int8)
+    return values, codes
+
+
+class BatchValidation:
+    """Result of validating a batch of parameter sets against a schema
+
+    ``codes`` holds one code per row and parameter (VALID, MISSING, INVALID
+    or OUT_OF_RANGE), ``values`` the coerced floats in schema order.
+    """
+
+    def __init__(self, schema: 'ParameterSchema', values: np.ndarray, codes: np.ndarray):
+        self.schema = schema
+        self.values = values
+        self.codes = codes
+        self.valid = ~codes.any(axis=1)
+
+    @property
+    def row_codes(self) -> np.ndarray:
+        """Code of the first failing parameter in each row, VALID if none"""
+        failing = self.codes != VALID
+        first = failing.argmax(axis=1)
+        return np.where(failing.any(axis=1), self.codes[np.arange(len(self.codes)), first], VALID)
+
+    def column_failures(self) -> Dict[str, int]:
+        """Number of failing rows per parameter"""
+        counts = (self.codes != VALID).sum(axis=0)
+        return dict(zip(self.schema.names, counts.tolist()))
+
+    def errors(self, row: int) -> Dict[str, str]:
+        """Error messages for one row, in the same form as validate_all_parameters"""
+        return {
+            self.schema.names[i]: self.schema.message(i, code)
+            for i, code in enumerate(self.codes[row].tolist()) if code != VALID
+        }
+
+    def failed_rows(self) -> Dict[int, Dict[str, str]]:
+        """Error messages for the failing rows only"""
+        return {row: self.errors(row) for row in np.flatnonzero(~self.valid).tolist()}
+
+
+class ParameterSchema:
+    """Column order, dtype and range bounds of one disease's parameters
+
+    Compiled once from DISEASE_PARAMETERS so inputs are laid out by
+    parameter name, whatever order the stored dict comes back in.
+    """
+
+    dtype = np.float64
+
+    def __init__(self, disease: str, parameters: Dict[str, Dict[str, Any]]):
+        self.disease = disease
+        self.names = tuple(parameters)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.ranges = [meta.get('range') for meta in parameters.values()]
+        self.low = np.array([r[0] if r else -np.inf for r in self.ranges], dtype=self.dtype)
+        self.high = np.array([r[1] if r else np.inf for r in self.ranges], dtype=self.dtype)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def matrix(self, rows: List[Dict[str, Any]], dtype: Any = None) -> np.ndarray:
+        """Parameter dicts as a (len(rows), len(schema)) float array, by default of ``self.dtype``"""
+        try:
+            values = np.fromiter(
+                (float(row[name]) for row in rows for name in self.names),
+                dtype=dtype or self.dtype, count=len(rows) * len(self.names)
+            )
+        except KeyError as e:
+            raise ValueError(f"Missing parameter: {e.args[0]}")
+        return values.reshape(len(rows), len(self.names))
+
+    def axis(self, name: str, steps: int) -> np.ndarray:
+        """Evenly spaced values across a parameter's range
+
+        Integer ranges narrower than ``steps`` use every integer instead.
+        """
+        i = self.index[name]
+        low, high = self.ranges[i]
+        if isinstance(low, int) and isinstance(high, int) and high - low + 1 <= steps:
+            return np.arange(low, high + 1, dtype=self.dtype)
+        return np.linspace(low, high, steps, dtype=self.dtype)
+
+    def sweep(self, data: Dict[str, Any], names: List[str], steps: int) -> Tuple[List[np.ndarray], np.ndarray]:
+        """Rows varying ``names`` over a grid while the other parameters keep their values
+
+        Returns the axis values and a matrix with one row per grid point,
+        the last name varying fastest.
+        """
+        axes = [self.axis(name, steps) for name in names]
+        grid = np.meshgrid(*axes, indexing='ij')
+        matrix = np.repeat(self.vector(data)[None, :], grid[0].size, axis=0)
+        for name, values in zip(names, grid):
+            matrix[:, self.index[name]] = values.ravel()
+        return axes, matrix
+
+    def midpoints(self) -> np.ndarray:
+        """Middle of every parameter's valid range, a safe synthetic input"""
+        return np.where(np.isfinite(self.low) & np.isfinite(self.high), (self.low + self.high) / 2, 0.0)
+
+    def vector(self, data: Dict[str, Any]) -> np.ndarray:
+        """One parameter dict as a 1-D float array in schema order"""
+        return self.matrix([data])[0]
+
+    def _range_error(self, i: int) -> str:
+        low, high = self.ranges[i]
+        return f"{self.names[i]} out of range ({low}-{high})"
+
+    def message(self, i: int, code: int) -> str:
+        """Human-readable message for a validation code of parameter ``i``"""
+        name = self.names[i]
+        if code == MISSING:
+            return f"Missing parameter: {name}"
+        if code == INVALID:
+            return f"Invalid value for {name}"
+        return self._range_error(i)
+
+    def validate_batch(self, batch: Any) -> BatchValidation:
+        """Validate many parameter sets with vectorized range checks
+
+        ``batch`` is a 2-D array in schema column order, a dict of columns
+        keyed by parameter name, or a list of parameter dicts.
+        """
+        if isinstance(batch, np.ndarray):
+            if batch.ndim != 2 or batch.shape[1] != len(self.names):
+                raise ValueError(f"Expected array of shape (n, {len(self.names)}), got {batch.shape}")
+            columns = [batch[:, i] for i in range(len(self.names))]
+            n_rows = batch.shape[0]
+        elif isinstance(batch, dict):
+            n_rows = max((len(column) for column in batch.values()), default=0)
+            columns = [batch.get(name, [None] * n_rows) for name in self.names]
+        else:
+            n_rows = len(batch)
+            columns = [[row.get(name) for row in batch] for name in self.names]
+
+        values = np.empty((n_rows, len(self.names)), dtype=self.dtype)
+        codes = np.empty((n_rows, len(self.names)), dtype=np.int8)
+        for i, column in enumerate(columns):
+            values[:, i], codes[:, i] = _coerce_column(column)
+        out_of_range = (values < self.low) | (values > self.high)
+        codes[(codes == VALID) & out_of_range] = OUT_OF_RANGE
+        return BatchValidation(self, values, codes)
+
+    def validate(self, data: Dict[str, Any]) -> Dict[str, str]:
+        """Error message per failing parameter, empty when all are valid"""
+        errors = {}
+        values = np.zeros(len(self.names), dtype=self.dtype)
+        for i, name in enumerate(self.names):
+            value = data.get(name)
+            if value is None:
+                errors[name] = f"Missing parameter: {name}"
+                continue
+            try:
+                values[i] = float(value)
+            except Exception:
+                errors[name] = f"Invalid value for {name}"
+        for i in np.flatnonzero((values < self.low) | (values > self.high)):
+            errors.setdefault(self.names[i], self._range_error(i))
+        # Report in schema order, as callers show the first error
+        return {name: errors[name] for name in self.names if name in errors}
+
+    def validate_value(self, name: str, value: Any) -> Optional[str]:
+        """Error message for a single parameter value, or None"""
+        i = self.index[name]
         try:
-            value_cast = float(value)
-            if rng and (value_cast < rng[0] or value_cast > rng[1]):
-                errors[param] = f"{param} out of range ({rng[0]}-{rng[1]})"
+            val = float(value)
         except Exception:
-            errors[param] = f"Invalid value for {param}"
-    return (len(errors) == 0), errors
+            return f"Invalid value for {name}"
+        if val < self.low[i] or val > self.high[i]:
+            return self._range_error(i)
+        return None
 
 DISEASE_PARAMETERS = {
     "diabetes": {
@@ -369,11 +1141,17 @@ DISEASE_PARAMETERS = {
 }
 
 
+# Schemas compiled once at import from DISEASE_PARAMETERS
+DISEASE_SCHEMAS = {
+    disease: ParameterSchema(disease, parameters)
+    for disease, parameters in DISEASE_PARAMETERS.items()
+}
 
 class DiseaseParameterWorkflow:
     def __init__(self, disease_type: str):
         self.disease_type = disease_type.lower()
         self.parameters = DISEASE_PARAMETERS.get(self.disease_type, {})
+        self.schema = DISEASE_SCHEMAS.get(self.disease_type)
         self.collected: Dict[str, str] = {}
         self.finished = False
 
@@ -388,15 +1166,8 @@ class DiseaseParameterWorkflow:
     def validate_parameter(self, name: str, value: str):
         if name not in self.parameters:
             return False, f"Unknown parameter: {name}"
-        meta = self.parameters[name]
-        rng = meta.get('range')
-        try:
-            val = float(value)
-            if rng and (val < rng[0] or val > rng[1]):
-                return False, f"{name} out of range ({rng[0]}-{rng[1]})"
-        except Exception:
-            return False, f"Invalid value for {name}"
-        return True, None
+        error = self.schema.validate_value(name, value)
+        return error is None, error
 
     def collect_parameter(self, name: str, value: str):
         valid, err = self.validate_parameter(name, value)
@@ -0,0 +1,216 @@
+"""Reference-population percentiles for disease parameters.
+
+Usage:
+    python percentiles.py build reference.csv --disease heart
+        [--map file_column=parameter ...] [--levels 101] [--output models/percentiles.npz]
+    python percentiles.py show [--disease heart] [--tables models/percentiles.npz]
+
+``build`` streams a reference dataset (CSV, or Parquet with pyarrow),
+keeps the valid in-range values of each parameter and stores their
+quantiles at evenly spaced levels; tables of other diseases already in the
+output file are kept. At serving time ``PercentileIndex`` places a full
+parameter set (or a whole batch) in those tables with one vectorized
+comparison against every quantile, interpolating between levels.
+"""
+
+import argparse
+import logging
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import Config
+from models import DISEASE_SCHEMAS, VALID
+
+logger = logging.getLogger(__name__)
+
+LEVELS_KEY = '__levels__'
+
+
+class PercentileTable:
+    """Sorted quantiles of each parameter of one disease, shape (parameters, levels)"""
+
+    def __init__(self, names: List[str], quantiles: np.ndarray, levels: np.ndarray):
+        self.names = list(names)
+        self.quantiles = np.asarray(quantiles, dtype=np.float64)
+        self.levels = np.asarray(levels, dtype=np.float64)
+
+    @classmethod
+    def from_values(cls, columns: Dict[str, np.ndarray], levels: np.ndarray) -> 'PercentileTable':
+        names = [name for name, values in columns.items() if len(values)]
+        quantiles = np.array([np.percentile(columns[name], levels) for name in names])
+        return cls(names, quantiles.reshape(len(names), len(levels)), levels)
+
+    def lookup_batch(self, X: np.ndarray) -> np.ndarray:
+        """Percentile of every value in ``X`` (rows, parameters in table order)
+
+        Values tied with quantiles get the middle of the tied levels;
+        others are interpolated between neighbouring levels and clamped to
+        0-100 outside the reference range. NaN stays NaN.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        Q, levels = self.quantiles, self.levels
+        n_levels = len(levels)
+        below = (Q[None] < X[:, :, None]).sum(axis=2)
+        at_or_below = (Q[None] <= X[:, :, None]).sum(axis=2)
+
+        tied = (levels[np.minimum(below, n_levels - 1)] + levels[np.maximum(at_or_below - 1, 0)]) / 2
+        upper = np.clip(below, 1, n_levels - 1)
+        rows = np.arange(len(self.names))[None, :]
+        q0, q1 = Q[rows, upper - 1], Q[rows, upper]
+        fraction = np.clip((X - q0) / np.where(q1 > q0, q1 - q0, 1.0), 0.0, 1.0)
+        between = levels[upper - 1] + fraction * (levels[upper] - levels[upper - 1])
+
+        percentiles = np.where(at_or_below > below, tied, between)
+        return np.where(np.isnan(X), np.nan, percentiles)
+
+
+class PercentileIndex:
+    """Percentile tables for every disease, loaded from one ``.npz`` file"""
+
+    def __init__(self, tables: Optional[Dict[str, PercentileTable]] = None):
+        self.tables = tables or {}
+
+    @classmethod
+    def load(cls, path: str) -> 'PercentileIndex':
+        if not path or not os.path.exists(path):
+            return cls()
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                levels = data[LEVELS_KEY]
+                columns = defaultdict(dict)
+                for key in data.files:
+                    if key != LEVELS_KEY:
+                        disease, name = key.split('/', 1)
+                        columns[disease][name] = data[key]
+        except Exception as e:
+            logger.error(f"Failed to load percentile tables from {path}: {e}")
+            return cls()
+        tables = {}
+        for disease, by_name in columns.items():
+            # Keep schema order so lookups line up with schema vectors
+            schema = DISEASE_SCHEMAS.get(disease)
+            names = [name for name in (schema.names if schema else by_name) if name in by_name]
+            tables[disease] = PercentileTable(names, np.array([by_name[name] for name in names]), levels)
+        return cls(tables)
+
+    def save(self, path: str):
+        levels = [table.levels for table in self.tables.values()]
+        if any(not np.array_equal(levels[0], other) for other in levels[1:]):
+            raise ValueError('All tables in one file must use the same levels')
+        arrays = {LEVELS_KEY: levels[0] if levels else np.array([])}
+        for disease, table in self.tables.items():
+            for name, quantiles in zip(table.names, table.quantiles):
+                arrays[f'{disease}/{name}'] = quantiles
+        tmp_path = f'{path}.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def lookup(self, disease: str, parameters: Dict[str, Any]) -> Dict[str, float]:
+        """Percentile of each parameter with a reference table; empty if there is none"""
+        table = self.tables.get(disease)
+        if table is None:
+            return {}
+        values = np.array([_to_float(parameters.get(name)) for name in table.names])
+        return _as_dict(table.names, table.lookup_batch(values[None, :])[0])
+
+    def lookup_matrix(self, disease: str, matrix: np.ndarray) -> List[Dict[str, float]]:
+        """Percentiles for rows already in schema column order (e.g. validate_batch values)"""
+        table = self.tables.get(disease)
+        schema = DISEASE_SCHEMAS.get(disease)
+        if table is None or schema is None:
+            return [{} for _ in range(len(matrix))]
+        columns = [schema.index[name] for name in table.names]
+        return [_as_dict(table.names, row) for row in table.lookup_batch(matrix[:, columns])]
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _as_dict(names: List[str], percentiles: np.ndarray) -> Dict[str, float]:
+    return {name: round(float(p), 1) for name, p in zip(names, percentiles) if not np.isnan(p)}
+
+
+def build(args):
+    # Imported here so serving does not pull in the cohort CLI
+    from score_cohort import read_chunks, read_header
+
+    disease = args.disease.lower()
+    schema = DISEASE_SCHEMAS.get(disease)
+    if schema is None:
+        raise SystemExit(f"No schema for disease '{args.disease}'")
+    header = read_header(args.input)
+    mapping = {parameter: column for column, parameter in (item.split('=', 1) for item in args.map)}
+    by_lower = {name.lower(): name for name in header}
+    columns = {name: mapping.get(name) or by_lower.get(name.lower()) for name in schema.names}
+    columns = {name: column for name, column in columns.items() if column in header}
+    if not columns:
+        raise SystemExit(f"No {disease} parameters found in {args.input}")
+
+    values = defaultdict(list)
+    rows = 0
+    for raw in read_chunks(args.input, list(dict.fromkeys(columns.values())), args.chunk_size):
+        chunk = {name: raw[column] for name, column in columns.items()}
+        validation = schema.validate_batch(chunk)
+        rows += len(validation.valid)
+        for name in columns:
+            i = schema.index[name]
+            values[name].append(validation.values[validation.codes[:, i] == VALID, i])
+
+    levels = np.linspace(0, 100, args.levels)
+    table = PercentileTable.from_values(
+        {name: np.concatenate(values[name]) for name in columns}, levels
+    )
+    index = PercentileIndex.load(args.output)
+    index.tables[disease] = table
+    index.save(args.output)
+    print(f"Built {disease} percentiles for {len(table.names)} parameters from {rows} rows "
+          f"({args.levels} levels) into {args.output}")
+    skipped = [name for name in schema.names if name not in table.names]
+    if skipped:
+        print(f"No reference data for: {', '.join(skipped)}")
+
+
+def show(args):
+    index = PercentileIndex.load(args.tables)
+    for disease, table in index.tables.items():
+        if args.disease and disease != args.disease.lower():
+            continue
+        print(disease)
+        for name, quantiles in zip(table.names, table.quantiles):
+            p5, p50, p95 = np.interp([5, 50, 95], table.levels, quantiles)
+            print(f"  {name:<30} p5 {p5:>10.3f}  p50 {p50:>10.3f}  p95 {p95:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='build tables from a reference dataset')
+    build_parser.add_argument('input', help='CSV or Parquet reference dataset')
+    build_parser.add_argument('--disease', required=True)
+    build_parser.add_argument('--map', action='append', default=[], metavar='COLUMN=PARAMETER')
+    build_parser.add_argument('--levels', type=int, default=101, help='quantile levels from 0 to 100')
+    build_parser.add_argument('--chunk-size', type=int, default=100000)
+    build_parser.add_argument('--output', default=Config.PERCENTILE_TABLES or 'models/percentiles.npz')
+
+    show_parser = commands.add_parser('show', help='print p5/p50/p95 of stored tables')
+    show_parser.add_argument('--disease')
+    show_parser.add_argument('--tables', default=Config.PERCENTILE_TABLES or 'models/percentiles.npz')
+
+    args = parser.parse_args()
+    {'build': build, 'show': show}[args.command](args)
+
+
+# Tables for the serving process; empty when no file has been built yet
+reference_percentiles = PercentileIndex.load(Config.PERCENTILE_TABLES)
+
+
+if __name__ == '__main__':
+    main()
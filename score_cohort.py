@@ -0,0 +1,296 @@
+"""Stream a cohort file through a disease model in fixed-size chunks.
+
+Usage:
+    python score_cohort.py cohort.csv --disease heart --output scores.csv
+        [--chunk-size 10000] [--workers 4] [--map file_column=parameter ...]
+        [--id-column patient_id]
+
+CSV is read with the standard library; Parquet input or output (by file
+extension) needs pyarrow. Columns are matched to the disease's
+DISEASE_PARAMETERS names case-insensitively unless mapped with --map.
+
+Each chunk is validated with ParameterSchema.validate_batch and its valid
+rows scored with one predict_batch call in a worker process. At most a few
+chunks per worker are in flight and results are written as soon as their
+chunk is done, in input order, so memory use does not grow with file size.
+"""
+
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from models import DISEASE_PREDICTORS, DISEASE_SCHEMAS, PredictionError
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_COLUMNS = ['row', 'status', 'prediction', 'confidence', 'model_version', 'error']
+
+
+def is_parquet(path: str) -> bool:
+    return path.lower().endswith(('.parquet', '.pq'))
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("Parquet files need the pyarrow package (pip install pyarrow)")
+    return pyarrow
+
+
+def read_header(path: str) -> List[str]:
+    if is_parquet(path):
+        return list(_pyarrow().parquet.ParquetFile(path).schema_arrow.names)
+    with open(path, newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def read_chunks(path: str, columns: List[str], chunk_size: int) -> Iterator[Dict[str, list]]:
+    """Yield dicts of column name to values, ``chunk_size`` rows at a time
+
+    Empty CSV fields come back as None so they validate as missing.
+    """
+    if is_parquet(path):
+        parquet_file = _pyarrow().parquet.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield {name: batch.column(name).to_pylist() for name in columns}
+        return
+
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        positions = [header.index(name) for name in columns]
+        chunk = {name: [] for name in columns}
+        size = 0
+        for record in reader:
+            for name, position in zip(columns, positions):
+                value = record[position] if position < len(record) else ''
+                chunk[name].append(value if value != '' else None)
+            size += 1
+            if size == chunk_size:
+                yield chunk
+                chunk = {name: [] for name in columns}
+                size = 0
+        if size:
+            yield chunk
+
+
+def read_column_type(path: str, column: str) -> Any:
+    """Arrow type of a Parquet column; CSV values are always strings"""
+    if is_parquet(path):
+        return _pyarrow().parquet.ParquetFile(path).schema_arrow.field(column).type
+    return _pyarrow().string()
+
+
+class ResultWriter:
+    """Appends scored chunks to a CSV or Parquet file
+
+    Parquet output uses one schema fixed up front, since a chunk whose
+    rows are all valid (or all invalid) has columns that are entirely
+    null and would otherwise be typed ``null``. ``label_dtype`` is the
+    NumPy dtype of the model's labels and ``id_type`` the Arrow type of
+    the id column.
+    """
+
+    def __init__(self, path: str, id_column: Optional[str] = None, label_dtype: Any = None,
+                 id_type: Any = None):
+        self.columns = ([id_column] if id_column else []) + OUTPUT_COLUMNS
+        self.parquet = is_parquet(path)
+        if self.parquet:
+            self._arrow = _pyarrow()
+            self._writer = None
+            self._path = path
+            self.schema = self._schema(id_column, label_dtype, id_type)
+        else:
+            self._file = open(path, 'w', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.columns)
+
+    def _schema(self, id_column: Optional[str], label_dtype: Any, id_type: Any) -> Any:
+        pa = self._arrow
+        try:
+            label_type = pa.from_numpy_dtype(np.dtype(label_dtype)) if label_dtype is not None else pa.string()
+        except (TypeError, NotImplementedError):
+            label_type = pa.string()
+        fields = [
+            ('row', pa.int64()),
+            ('status', pa.string()),
+            ('prediction', label_type),
+            ('confidence', pa.float64()),
+            ('model_version', pa.string()),
+            ('error', pa.string()),
+        ]
+        if id_column:
+            fields.insert(0, (id_column, id_type or pa.string()))
+        return pa.schema(fields)
+
+    def write(self, rows: Dict[str, list]):
+        if self.parquet:
+            table = self._arrow.table({name: rows[name] for name in self.columns}, schema=self.schema)
+            if self._writer is None:
+                self._writer = self._arrow.parquet.ParquetWriter(self._path, self.schema)
+            self._writer.write_table(table)
+        else:
+            self._writer.writerows(zip(*(rows[name] for name in self.columns)))
+            self._file.flush()
+
+    def close(self):
+        if self.parquet:
+            if self._writer is not None:
+                self._writer.close()
+        else:
+            self._file.close()
+
+
+def resolve_columns(disease: str, header: List[str], mapping: Dict[str, str]) -> Dict[str, str]:
+    """Map each schema parameter to the input column that holds it"""
+    by_lower = {name.lower(): name for name in header}
+    parameter_to_column = {parameter: column for column, parameter in mapping.items()}
+    resolved = {}
+    for parameter in DISEASE_SCHEMAS[disease].names:
+        column = parameter_to_column.get(parameter) or by_lower.get(parameter.lower())
+        if column is None or column not in header:
+            raise SystemExit(f"No column for {disease} parameter '{parameter}'; use --map column={parameter}")
+        resolved[parameter] = column
+    return resolved
+
+
+def _init_worker(disease: str):
+    """Load and warm up the model once per worker process"""
+    DISEASE_PREDICTORS.warm_up([disease])
+
+
+def score_chunk(disease: str, start: int, chunk: Dict[str, list], ids: Optional[list]) -> Dict[str, list]:
+    """Validate and score one chunk, returning output columns"""
+    schema = DISEASE_SCHEMAS[disease]
+    validation = schema.validate_batch(chunk)
+    n_rows = len(validation.valid)
+    status = np.where(validation.valid, 'ok', 'invalid').astype(object)
+    predictions: List[Any] = [None] * n_rows
+    confidences: List[Any] = [None] * n_rows
+    errors: List[Any] = [None] * n_rows
+    version = None
+
+    for row, row_errors in validation.failed_rows().items():
+        errors[row] = next(iter(row_errors.values()))
+
+    valid_rows = np.flatnonzero(validation.valid)
+    if len(valid_rows):
+        try:
+            predictor = DISEASE_PREDICTORS[disease]
+            version = predictor.version
+            labels, scores = predictor.predict_batch(validation.values[valid_rows])
+            for row, label, score in zip(valid_rows.tolist(), labels.tolist(), scores.tolist()):
+                predictions[row], confidences[row] = label, score
+        except Exception as e:
+            status[valid_rows] = 'error'
+            for row in valid_rows.tolist():
+                errors[row] = str(e)
+
+    rows = {
+        'row': list(range(start, start + n_rows)),
+        'status': status.tolist(),
+        'prediction': predictions,
+        'confidence': confidences,
+        'model_version': [version if s != 'invalid' else None for s in status.tolist()],
+        'error': errors,
+    }
+    if ids is not None:
+        rows['id'] = ids
+    return rows
+
+
+def score_file(args) -> Dict[str, Any]:
+    disease = args.disease.lower()
+    if disease not in DISEASE_SCHEMAS or disease not in DISEASE_PREDICTORS:
+        raise SystemExit(f"No model and schema for disease '{args.disease}'")
+
+    header = read_header(args.input)
+    mapping = dict(item.split('=', 1) for item in args.map)
+    columns = resolve_columns(disease, header, mapping)
+    if args.id_column and args.id_column not in header:
+        raise SystemExit(f"Id column '{args.id_column}' not found in {args.input}")
+    if args.id_column in OUTPUT_COLUMNS:
+        raise SystemExit(f"Id column '{args.id_column}' would overwrite the output column of the same name")
+
+    # Fail here rather than in every worker when the model cannot be loaded
+    try:
+        predictor = DISEASE_PREDICTORS[disease]
+    except PredictionError as e:
+        raise SystemExit(f"Cannot load the {disease} model: {e}")
+    source_columns = list(dict.fromkeys(list(columns.values()) + ([args.id_column] if args.id_column else [])))
+
+    def tasks() -> Iterator[Tuple[int, Dict[str, list], Optional[list]]]:
+        start = 0
+        for raw in read_chunks(args.input, source_columns, args.chunk_size):
+            chunk = {parameter: raw[column] for parameter, column in columns.items()}
+            ids = raw[args.id_column] if args.id_column else None
+            yield start, chunk, ids
+            start += len(next(iter(raw.values())))
+
+    id_type = read_column_type(args.input, args.id_column) if args.id_column and is_parquet(args.output) else None
+    classes = getattr(predictor.model, 'classes_', None)
+    writer = ResultWriter(args.output, args.id_column, classes.dtype if classes is not None else None, id_type)
+    totals = {'rows': 0, 'ok': 0, 'invalid': 0, 'error': 0}
+
+    def write(rows: Dict[str, list]):
+        if args.id_column:
+            rows[args.id_column] = rows.pop('id')
+        writer.write(rows)
+        totals['rows'] += len(rows['row'])
+        for status in ('ok', 'invalid', 'error'):
+            totals[status] += rows['status'].count(status)
+
+    started = time.perf_counter()
+    try:
+        if args.workers <= 0:
+            _init_worker(disease)
+            for start, chunk, ids in tasks():
+                write(score_chunk(disease, start, chunk, ids))
+        else:
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(args.workers, initializer=_init_worker, initargs=(disease,)) as pool:
+                # Bound the chunks in flight so a fast reader cannot fill memory
+                in_flight = deque()
+                for start, chunk, ids in tasks():
+                    in_flight.append(pool.apply_async(score_chunk, (disease, start, chunk, ids)))
+                    if len(in_flight) >= args.workers * 2:
+                        write(in_flight.popleft().get())
+                while in_flight:
+                    write(in_flight.popleft().get())
+    finally:
+        writer.close()
+
+    totals['seconds'] = time.perf_counter() - started
+    totals['rows_per_s'] = totals['rows'] / totals['seconds'] if totals['seconds'] else 0.0
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help='CSV or Parquet cohort file')
+    parser.add_argument('--disease', required=True, choices=sorted(DISEASE_SCHEMAS))
+    parser.add_argument('--output', required=True, help='CSV or Parquet file for the scores')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='rows per chunk')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='scoring processes; 0 scores in this process')
+    parser.add_argument('--map', action='append', default=[], metavar='COLUMN=PARAMETER',
+                        help='input column holding a parameter (repeatable)')
+    parser.add_argument('--id-column', help='input column copied to the output to identify rows')
+    args = parser.parse_args()
+
+    totals = score_file(args)
+    print(f"Scored {totals['rows']} rows in {totals['seconds']:.1f}s ({totals['rows_per_s']:.0f} rows/s): "
+          f"{totals['ok']} ok, {totals['invalid']} invalid, {totals['error']} failed")
+
+
+if __name__ == '__main__':
+    main()
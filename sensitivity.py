@@ -0,0 +1,114 @@
+"""What-if sensitivity analysis for completed predictions.
+
+One or two parameters of a prediction are swept across their
+DISEASE_PARAMETERS range while the others keep the patient's values, and
+the whole grid is scored with a single batched model call on the
+inference executor. Results are cached per prediction, inputs and model
+version, so repeated views of the same analysis do not touch the model.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from cache import RedisBackend, TTLCache, shared_backend
+from config import Config
+from inference import InferenceExecutor, inference_executor
+from models import DISEASE_PREDICTORS, DISEASE_SCHEMAS
+
+logger = logging.getLogger(__name__)
+
+
+class SensitivityAnalyzer:
+    """Scores parameter grids for predictions and caches the results"""
+
+    def __init__(self, executor: InferenceExecutor, local: TTLCache,
+                 shared: Optional[RedisBackend] = None, max_steps: int = 50):
+        self.executor = executor
+        self.local = local
+        self.shared = shared
+        self.max_steps = max_steps
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, executor: InferenceExecutor) -> 'SensitivityAnalyzer':
+        ttl = Config.PREDICTION_CACHE_TTL
+        return cls(
+            executor,
+            TTLCache(Config.SENSITIVITY_CACHE_SIZE, ttl),
+            shared_backend(Config.CACHE_REDIS_URL, 'medipredict:sensitivity:', ttl),
+            max_steps=Config.SENSITIVITY_MAX_STEPS,
+        )
+
+    @staticmethod
+    def key(prediction_id: str, disease: str, version: str, parameters: Dict[str, Any],
+            names: List[str], steps: int) -> str:
+        # The parameters are part of the key so an edited prediction is never served stale results
+        payload = json.dumps([parameters, names, steps], sort_keys=True, default=str)
+        return f"{prediction_id}:{disease}:{version}:{hashlib.sha1(payload.encode()).hexdigest()}"
+
+    def analyze(self, prediction_id: str, disease: str, parameters: Dict[str, Any],
+                names: List[str], steps: Optional[int] = None) -> Dict[str, Any]:
+        """Risk across a grid of one or two parameters
+
+        Raises ValueError for unknown or too many parameter names, an
+        invalid step count, or a prediction whose parameters do not validate.
+        """
+        schema = DISEASE_SCHEMAS.get(disease)
+        if schema is None or disease not in DISEASE_PREDICTORS:
+            raise ValueError(f'No predictor found for {disease}')
+        if not 1 <= len(names) <= 2 or len(set(names)) != len(names):
+            raise ValueError('Choose one or two different parameters')
+        unknown = [name for name in names if name not in schema.index]
+        if unknown:
+            raise ValueError(f'Unknown parameter: {unknown[0]}')
+        steps = steps or (25 if len(names) == 1 else 15)
+        if not 2 <= steps <= self.max_steps:
+            raise ValueError(f'Steps must be between 2 and {self.max_steps}')
+        errors = schema.validate(parameters)
+        if errors:
+            raise ValueError(next(iter(errors.values())))
+
+        key = self.key(prediction_id, disease, DISEASE_PREDICTORS.version(disease), parameters, names, steps)
+        cached = self.local.get(key)
+        if cached is None and self.shared is not None:
+            cached = self.shared.get(key)
+            if cached is not None:
+                self.local.set(key, cached)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        axes, matrix = schema.sweep(parameters, names, steps)
+        (labels, risk), version = self.executor.run(disease, 'predict_risk_batch', matrix)
+        shape = [len(axis) for axis in axes]
+        analysis = {
+            'prediction_id': prediction_id,
+            'disease_type': disease,
+            'model_version': version,
+            'parameters': names,
+            'axes': {name: axis.tolist() for name, axis in zip(names, axes)},
+            'baseline': {name: float(schema.vector(parameters)[schema.index[name]]) for name in names},
+            'risk': risk.reshape(shape).tolist(),
+            'labels': labels.reshape(shape).tolist(),
+        }
+        self.local.set(key, analysis)
+        if self.shared is not None:
+            self.shared.set(key, analysis)
+        return analysis
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.local),
+        }
+
+
+# Shared analyzer for HTTP routes
+sensitivity_analyzer = SensitivityAnalyzer.from_config(inference_executor)
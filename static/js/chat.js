@@ -332,6 +332,8 @@ document.addEventListener('DOMContentLoaded', () => {
         });
         
         this.socket.on('error', (data) => {
+          // Drop a reply that was still streaming when the request failed
+          this.state.messages = this.state.messages.filter(message => !message.streaming);
           if (data?.message) {
             alert('Error: ' + data.message);
           }
@@ -394,11 +396,46 @@ document.addEventListener('DOMContentLoaded', () => {
               metadata: data.metadata || {}
             };
             
-            this.state.messages.push(message);
+            // The user's message is saved after a streamed reply started, so keep it above the reply
+            const streamingIndex = this.state.messages.findIndex(m => m.streaming);
+            if (streamingIndex === -1) {
+              this.state.messages.push(message);
+            } else {
+              this.state.messages.splice(streamingIndex, 0, message);
+            }
+            this.updateMessages();
+          }
+        });
+        
+        this.socket.on('ai_response_started', (data) => {
+          if (data?.conversation_id === this.state.currentConversationId) {
+            this.state.messages.push({
+              message_id: data.response_id,
+              type: 'ai',
+              content: '',
+              timestamp: new Date().toISOString(),
+              conversation_id: data.conversation_id,
+              streaming: true
+            });
             this.updateMessages();
           }
         });
         
+        this.socket.on('ai_response_delta', (data) => {
+          if (data?.conversation_id !== this.state.currentConversationId) return;
+          const index = this.state.messages.findIndex(m => m.message_id === data.response_id);
+          if (index === -1) return;
+          const message = this.state.messages[index];
+          message.content += data.delta;
+          // Only touch the streaming bubble instead of re-rendering the whole list
+          const bubbles = this.elements.chatMessages?.querySelectorAll('.message-text');
+          const bubble = bubbles?.[index];
+          if (bubble) {
+            bubble.textContent = message.content;
+            this.elements.chatMessages.scrollTop = this.elements.chatMessages.scrollHeight;
+          }
+        });
+        
         this.socket.on('ai_response', (data) => {
           if (data?.conversation_id === this.state.currentConversationId) {
             const response = {
@@ -409,7 +446,13 @@ document.addEventListener('DOMContentLoaded', () => {
               conversation_id: data.conversation_id,
             };
             
-            this.state.messages.push(response);
+            // Replace the streamed draft with the saved reply
+            const index = this.state.messages.findIndex(m => m.message_id === data.response_id);
+            if (index === -1) {
+              this.state.messages.push(response);
+            } else {
+              this.state.messages[index] = response;
+            }
             this.updateMessages();
             this.updateMessageSending(false);
             this.updateAIResponseState(false);
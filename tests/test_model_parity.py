@@ -0,0 +1,69 @@
+"""Parity checks for the shipped disease models, on synthetic in-range rows"""
+
+import numpy as np
+import pytest
+
+from benchmark import legacy_predict
+from compiled_models import compare_models, compile_model
+from config import Config
+from models import DISEASE_PREDICTORS, DISEASE_SCHEMAS, DiseasePredictor
+
+DISEASES = sorted(DISEASE_PREDICTORS)
+
+
+def load(disease, **options):
+    return DiseasePredictor(DISEASE_PREDICTORS.resolve_path(disease), schema=DISEASE_SCHEMAS.get(disease), **options)
+
+
+@pytest.mark.parametrize('disease', DISEASES)
+def test_single_pass_matches_two_pass(disease):
+    predictor = load(disease)
+    inputs = predictor.synthetic_inputs(200)
+    labels, confidences = predictor.predict_batch(inputs)
+    for row, label, confidence in zip(inputs, labels, confidences):
+        expected_label, expected_confidence = legacy_predict(predictor.model, row[None, :])
+        assert label == expected_label
+        assert np.isclose(confidence, expected_confidence)
+
+
+@pytest.mark.parametrize('disease', DISEASES)
+def test_compiled_kernel_matches_estimator(disease):
+    predictor = load(disease)
+    estimator, kernel = predictor.model, compile_model(predictor.model)
+    inputs = predictor.synthetic_inputs(200)
+    assert np.array_equal(kernel.predict(inputs), estimator.predict(inputs))
+    if hasattr(estimator, 'predict_proba'):
+        np.testing.assert_allclose(kernel.predict_proba(inputs), estimator.predict_proba(inputs), atol=1e-12)
+
+
+@pytest.mark.parametrize('disease', DISEASES)
+def test_compiled_predictor_matches_sklearn(disease):
+    """Covers both the kernel and the hand-off to the estimator for large batches"""
+    reference, compiled = load(disease), load(disease, compiled=True)
+    inputs = reference.synthetic_inputs(1000)
+    for rows in (inputs[:1], inputs[:50], inputs):
+        expected_labels, expected_confidences = reference.predict_batch(rows)
+        labels, confidences = compiled.predict_batch(rows)
+        assert np.array_equal(labels, expected_labels)
+        np.testing.assert_allclose(confidences, expected_confidences, atol=1e-10)
+
+
+@pytest.mark.parametrize('disease', DISEASES)
+def test_float32_kernel_within_tolerance(disease):
+    predictor = load(disease)
+    inputs = predictor.synthetic_inputs(5000)
+    report = compare_models(predictor.model, compile_model(predictor.model, dtype=np.float32), inputs)
+    assert report['label_mismatches'] == 0
+    assert report['max_confidence_drift'] <= Config.PRECISION_TOLERANCE
+    served = load(disease, precision='float32')
+    assert served.precision == 'float32'
+    # Nothing float64 is kept alongside the float32 kernel
+    assert served.estimator is served.model
+    assert served._prepare_batch(inputs[:2]).dtype == np.float32
+
+
+def test_float32_falls_back_outside_tolerance(monkeypatch):
+    monkeypatch.setattr(Config, 'PRECISION_TOLERANCE', -1.0)
+    predictor = load(DISEASES[0], precision='float32')
+    assert predictor.precision == 'float64'
+    assert predictor.model is predictor.estimator
@@ -0,0 +1,53 @@
+"""Vectorized batch validation agrees with the per-row validator"""
+
+import numpy as np
+import pytest
+
+from models import DISEASE_SCHEMAS, validate_all_parameters
+
+DISEASES = sorted(DISEASE_SCHEMAS)
+
+
+def mixed_rows(schema, n=200, seed=0):
+    """Parameter dicts mixing valid, out-of-range, missing and non-numeric values"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        row = {}
+        for name, bounds in zip(schema.names, schema.ranges):
+            low, high = bounds or (0, 100)
+            kind = rng.choice(['valid', 'valid', 'string', 'low', 'high', 'missing', 'none', 'text'])
+            value = rng.uniform(low, high)
+            if kind == 'string':
+                row[name] = str(round(value, 2))
+            elif kind == 'low':
+                row[name] = low - 1 - value
+            elif kind == 'high':
+                row[name] = high + 1 + value
+            elif kind == 'none':
+                row[name] = None
+            elif kind == 'text':
+                row[name] = 'n/a'
+            elif kind == 'valid':
+                row[name] = value
+        rows.append(row)
+    # Edge cases: every value valid, every value at the bounds, an empty row
+    rows.append({name: (r[0] + r[1]) / 2 if r else 1.0 for name, r in zip(schema.names, schema.ranges)})
+    rows.append({name: r[0] if r else 0 for name, r in zip(schema.names, schema.ranges)})
+    rows.append({name: r[1] if r else 0 for name, r in zip(schema.names, schema.ranges)})
+    rows.append({})
+    return rows
+
+
+@pytest.mark.parametrize('disease', DISEASES)
+def test_validate_batch_matches_validate_all_parameters(disease):
+    schema = DISEASE_SCHEMAS[disease]
+    rows = mixed_rows(schema)
+    batch = schema.validate_batch(rows)
+    columns = schema.validate_batch({name: [row.get(name) for row in rows] for name in schema.names})
+    for i, row in enumerate(rows):
+        is_valid, errors = validate_all_parameters(disease, row)
+        assert bool(batch.valid[i]) == is_valid, row
+        assert batch.errors(i) == errors, row
+        assert columns.errors(i) == errors, row
+    assert not batch.valid.all() and batch.valid.any()
@@ -0,0 +1,27 @@
+"""Thread pools for background work.
+
+CPU-bound model calls need real OS threads: under gevent's monkey-patching
+a plain ThreadPoolExecutor runs its tasks as greenlets, which would block
+the Socket.IO loop while a model computes. Tasks that mostly wait on
+something else (the inference pool, the LLM API) are fine either way, so
+they use a plain pool, and greenlets when gevent has patched threading.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def native_thread_pool(max_workers: int, name: str):
+    """Thread pool of real OS threads, even when gevent has patched threading"""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+            return GeventThreadPoolExecutor(max_workers=max_workers)
+    except ImportError:
+        pass
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+
+def waiting_thread_pool(max_workers: int, name: str) -> ThreadPoolExecutor:
+    """Thread pool for tasks that spend their time waiting rather than computing"""
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
@@ -0,0 +1,32 @@
+"""Token estimates for prompt budgeting.
+
+Groq's Llama tokenizers are not available offline, so counts are an
+estimate: roughly four characters per token for prose, but never fewer
+than one token per word or punctuation mark (numbers, short words and
+symbols tokenize less densely). Actual prompt tokens are reported by the
+API with each completion; these estimates only have to be close enough to
+keep prompts inside a budget.
+"""
+
+import math
+import re
+from typing import Any, Dict, Iterable
+
+_PIECES = re.compile(r'\w+|[^\w\s]')
+
+# Role and separator tokens the chat template adds around every message
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(_PIECES.findall(text)))
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    return estimate_tokens(message.get('content') or '') + MESSAGE_OVERHEAD
+
+
+def messages_tokens(messages: Iterable[Dict[str, Any]]) -> int:
+    return sum(message_tokens(message) for message in messages)